@@ -248,29 +248,18 @@ def clarke(data, data_hat):
 
 def c2_sigmoid(x_vector, a, d, type):
 
-    if a.size == 1:
-        a = a*np.ones(shape=(x_vector.size,))
-
     # Auxiliary function
-    y = np.zeros(shape=(x_vector.size,))
-
-    for i in range(x_vector.size):
-
-        x = x_vector[i]
-
-        if type == '>=':
-            x_i = 2 / d * (x - a[i] - d/2)
-        elif type == '<=':
-            x_i = 2 / d * (x - a[i] + d / 2)
-
-        if x_i <= -1:
-            y[i] = 0
-        elif x_i >= 1:
-            y[i] = 1
-        elif x_i <= 0:
-            y[i] = 0.5 * (-(x_i**4) - 2*(x_i**3) + 2*x_i + 1)
-        else:
-            y[i] = 0.5 * (x_i ** 4 - 2 * (x_i ** 3) + 2 * x_i + 1)
+    if type == '>=':
+        x = 2 / d * (x_vector - a - d/2)
+    elif type == '<=':
+        x = 2 / d * (x_vector - a + d / 2)
+
+    # Piecewise quartic sigmoid, saturating at 0 below -1 and at 1 above 1
+    y = np.where(x <= 0,
+                 0.5 * (-(x**4) - 2*(x**3) + 2*x + 1),
+                 0.5 * (x ** 4 - 2 * (x ** 3) + 2 * x + 1))
+    y[x <= -1] = 0
+    y[x >= 1] = 1
 
     return y
 
@@ -319,12 +308,17 @@ def g_rmse(data, data_hat):
 
     if data.glucose.values.size == 0:
         return np.nan
-    idxs = np.where(np.logical_and(~np.isnan(data.glucose.values), ~np.isnan(data_hat.glucose.values)))[0]
-    if idxs.size == 0:
+
+    # check_comparable_data guarantees that data and data_hat share the same timegrid, so their samples are paired
+    # by position: no timestamp matching is needed
+    glucose = data.glucose.to_numpy(dtype=np.float64)
+    glucose_hat = data_hat.glucose.to_numpy(dtype=np.float64)
+    flags = ~(np.isnan(glucose) | np.isnan(glucose_hat))
+    if not flags.any():
         return np.nan
 
-    y = data.glucose.values[idxs]
-    yp = data_hat.glucose.values[idxs]
+    y = glucose[flags]
+    yp = glucose_hat[flags]
 
     # Parameters
     alpha_l = 1.5
@@ -1,7 +1,5 @@
 import pandas as pd
 import numpy as np
-import datetime
-from datetime import datetime, timedelta
 
 from py_agata.error import g_rmse
 
@@ -35,29 +33,13 @@ def test_g_rmse():
     None
     """
     # Set test data
-    t = np.arange(datetime(2000, 1, 1, 0, 0, 0), datetime(2000, 1, 1, 0, 55, 0), timedelta(minutes=5)).astype(
-        datetime)
-    glucose = np.zeros(shape=(t.shape[0],))
-    glucose[0] = 40
-    glucose[1:3] = [50, 50]
-    glucose[3] = 80
-    glucose[4:6] = [120, 120]
-    glucose[6:8] = [200, 200]
-    glucose[8:10] = [260, 260]
-    glucose[10] = np.nan
+    t = pd.date_range(start='2000-01-01', periods=11, freq='5min')
+    glucose = np.array([40, 50, 50, 80, 120, 120, 200, 200, 260, 260, np.nan], dtype=np.float64)
     d = {'t': t, 'glucose': glucose}
     data = pd.DataFrame(data=d)
 
-    t = np.arange(datetime(2000, 1, 1, 0, 0, 0), datetime(2000, 1, 1, 0, 55, 0), timedelta(minutes=5)).astype(
-        datetime)
-    glucose = np.zeros(shape=(t.shape[0],))
-    glucose[0] = 30
-    glucose[1:3] = [70, 70]
-    glucose[3] = 65
-    glucose[4:6] = [130, 130]
-    glucose[6:8] = [np.nan, np.nan]
-    glucose[8:10] = [260, 260]
-    glucose[10] = 260
+    t = pd.date_range(start='2000-01-01', periods=11, freq='5min')
+    glucose = np.array([30, 70, 70, 65, 130, 130, np.nan, np.nan, 260, 260, 260], dtype=np.float64)
     d = {'t': t, 'glucose': glucose}
     data_hat = pd.DataFrame(data=d)
 
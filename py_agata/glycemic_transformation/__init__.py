@@ -50,6 +50,26 @@ def mr_index(data, r=100):
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
+    # Return the result
+    return _mr_index_from_array(values, r)
+
+
+def _mr_index_from_array(values, r=100):
+    """
+    Computes the mr value by Schlichtkrull of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    r: int, optional, default : 100
+        Hyperparameter for mr value calculation
+
+    Returns
+    -------
+    mr_index: float
+        The mr value
+    """
     # Return nan if all values are nan
     if values.size == 0:
         return np.nan
@@ -100,6 +120,24 @@ def hypo_index(data):
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
+    # Return the result
+    return _hypo_index_from_array(values)
+
+
+def _hypo_index_from_array(values):
+    """
+    Computes the hypoglycemic index by Rodbard of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    hypo_index: float
+        The hypo index
+    """
     # Return nan if all values are nan
     if values.size == 0:
         return np.nan
@@ -154,6 +192,24 @@ def hyper_index(data):
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
+    # Return the result
+    return _hyper_index_from_array(values)
+
+
+def _hyper_index_from_array(values):
+    """
+    Computes the hyperglycemic index by Rodbard of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    hyper_index: float
+        The hyper index
+    """
     # Return nan if all values are nan
     if values.size == 0:
         return np.nan
@@ -205,8 +261,29 @@ def igc(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Compute metric
+    return _igc_from_array(values)
+
+
+def _igc_from_array(values):
+    """
+    Computes the index of glycemic control by Rodbard of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    igc: float
+        The index of glycemic control
+    """
     # Compute metric
-    return hypo_index(data) + hyper_index(data)
+    return _hypo_index_from_array(values) + _hyper_index_from_array(values)
 
 
 def grade_hypo_score(data):
@@ -251,12 +328,30 @@ def grade_hypo_score(data):
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
+    # Return the result
+    return _grade_hypo_score_from_array(values)
+
+
+def _grade_hypo_score_from_array(values):
+    """
+    Computes the GRADEhypo score of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    grade_hypo_score: float
+        The glycemic risk assessment diabetes equation score in the hypoglycemic range (GRADEhypo) (%).
+    """
     # Return nan if all values are nan
     if values.size == 0:
         return np.nan
 
-    # Set up the formula parameters
-    grade = 425 * (np.log10(np.log10(values / 18)) + .16)**2
+    # Compute the GRADE of each value
+    grade = _grade(values)
     g_tot = np.sum(grade)
     return 100 * np.sum(grade[values < 70]) / g_tot
 
@@ -303,12 +398,30 @@ def grade_hyper_score(data):
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
+    # Return the result
+    return _grade_hyper_score_from_array(values)
+
+
+def _grade_hyper_score_from_array(values):
+    """
+    Computes the GRADEhyper score of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    grade_hyper_score: float
+        The glycemic risk assessment diabetes equation score in the hyperglycemic range (GRADEhyper) (%).
+    """
     # Return nan if all values are nan
     if values.size == 0:
         return np.nan
 
-    # Set up the formula parameters
-    grade = 425 * (np.log10(np.log10(values / 18)) + .16)**2
+    # Compute the GRADE of each value
+    grade = _grade(values)
     g_tot = np.sum(grade)
     return 100 * np.sum(grade[values > 180]) / g_tot
 
@@ -352,7 +465,27 @@ def grade_eu_score(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    return 100 - (grade_hypo_score(data) + grade_hyper_score(data))
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    return _grade_eu_score_from_array(values)
+
+
+def _grade_eu_score_from_array(values):
+    """
+    Computes the GRADEeu score of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    grade_eu_score: float
+        The glycemic risk assessment diabetes equation score in the euglycemic range (GRADEeu) (%).
+    """
+    return 100 - (_grade_hypo_score_from_array(values) + _grade_hyper_score_from_array(values))
 
 
 def grade_score(data):
@@ -397,10 +530,75 @@ def grade_score(data):
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
+    # Return the result
+    return _grade_score_from_array(values)
+
+
+def _grade_score_from_array(values):
+    """
+    Computes the GRADE score of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    grade_score: float
+        The glycemic risk assessment diabetes equation score (GRADE) (%).
+    """
     # Return nan if all values are nan
     if values.size == 0:
         return np.nan
 
-    # Set up the formula parameters
-    grade = 425 * (np.log10(np.log10(values / 18)) + .16)**2
+    grade = _grade(values)
     return np.mean(grade)
+
+
+def _grade(values):
+    """
+    Computes the GRADE transformation of each of the given non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to transform (in mg/dl).
+
+    Returns
+    -------
+    grade: np.ndarray
+        The GRADE of each glucose value.
+    """
+    return 425 * (np.log10(np.log10(values / 18)) + .16)**2
+
+
+def _grade_kernel(values):
+    """
+    Computes the GRADE score and its hypoglycemic, hyperglycemic and euglycemic components at once, evaluating the
+    GRADE transformation a single time.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    grade: dict
+        A dictionary with fields `grade_score`, `grade_hypo_score`, `grade_hyper_score` and `grade_eu_score`.
+    """
+    # Return nan if all values are nan
+    if values.size == 0:
+        return {'grade_score': np.nan, 'grade_hypo_score': np.nan, 'grade_hyper_score': np.nan,
+                'grade_eu_score': np.nan}
+
+    grade = _grade(values)
+    g_tot = np.sum(grade)
+    grade_hypo_score = 100 * np.sum(grade[values < 70]) / g_tot
+    grade_hyper_score = 100 * np.sum(grade[values > 180]) / g_tot
+
+    return {'grade_score': g_tot / values.size,
+            'grade_hypo_score': grade_hypo_score,
+            'grade_hyper_score': grade_hyper_score,
+            'grade_eu_score': 100 - (grade_hypo_score + grade_hyper_score)}
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from copy import copy
 
 from py_agata.input_validator import *
+from py_agata.utils import _glucose_soa
 
 def find_nan_islands(data, th):
     """
@@ -128,10 +129,27 @@ def missing_glucose_percentage(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    if data.glucose.values.size == 0:
+    return _missing_glucose_percentage_from_soa(_glucose_soa(data))
+
+
+def _missing_glucose_percentage_from_soa(soa):
+    """
+    Computes the percentage of missing values of a glucose profile.
+
+    Parameters
+    ----------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile (see py_agata.utils._glucose_soa).
+
+    Returns
+    -------
+    missing_glucose_percentage: float
+        The percentage of missing glucose values.
+    """
+    if soa.glucose.size == 0:
         return np.nan
 
-    return 100 * np.sum(np.isnan(data.glucose))/ data.glucose.values.size
+    return 100 * np.sum(soa.nan_mask) / soa.glucose.size
 
 
 def number_days_of_observation(data):
@@ -169,11 +187,28 @@ def number_days_of_observation(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    if data.glucose.values.size == 0:
+    return _number_days_of_observation_from_soa(_glucose_soa(data))
+
+
+def _number_days_of_observation_from_soa(soa):
+    """
+    Computes the number of days of observation of a glucose profile.
+
+    Parameters
+    ----------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile (see py_agata.utils._glucose_soa).
+
+    Returns
+    -------
+    number_days_of_observation: float
+        The number of days of observation.
+    """
+    if soa.glucose.size == 0:
         return np.nan
 
-    start_time = pd.to_datetime(data.t.values[0]).to_pydatetime()
-    end_time = pd.to_datetime(data.t.values[-1]).to_pydatetime()
+    start_time = pd.to_datetime(soa.t[0]).to_pydatetime()
+    end_time = pd.to_datetime(soa.t[-1]).to_pydatetime()
     return (end_time - start_time).total_seconds() / (60 * 60 * 24)
 
 
@@ -239,77 +274,17 @@ def find_hypoglycemic_events(data, th=70.):
     if data.glucose.values.size == 0:
         return hypoglycemic_events
 
-    k = 0 #hypoglycemic_event vector current index
+    # Get the sampling time and the number of consecutive samples required to define the start/end of a valid event
     t0 = pd.to_datetime(data.t.values[0]).to_pydatetime()
     t1 = pd.to_datetime(data.t.values[1]).to_pydatetime()
     sample_time = (t1 - t0).total_seconds() / 60
+    n_samples_in = int(np.round(15/sample_time)) #number of consecutive samples required to define a valid event
+    n_samples_out = n_samples_in
 
-    n_samples = int(np.round(15/sample_time)) #number of consecutive samples required to define a valid event
-
-    count = 0 #number of current found consecutive samples
-
-    # state flag -> 0: no event, 1: found a valid hypo event and
-    #               currently in hypo, -1: found a valid hypo event and
-    #               currently not in hypo.
-    flag = 0
+    # Locate the hypoglycemic events as runs of consecutive samples < th (nan samples are never in event)
+    start_idxs, end_idxs = _find_events(data.glucose.values < th, n_samples_in=n_samples_in, n_samples_out=n_samples_out)
 
-    for t in range(data.glucose.values.size):
-
-        if data.glucose.values[t] < th:
-
-            # If it is a new event, reset count and set the hypothetical starting time to the current timestamp
-            if count <= 0:
-                count = 0
-                temp_start_time = pd.to_datetime(data.t.values[t]).to_pydatetime()
-
-            count = min([n_samples, count + 1]) #limit count to n_samples
-
-            # if count touches the "nSamples sample goal" we found a new event
-            if count == n_samples or flag == -1:
-                flag = 1
-
-        else:
-
-            if flag == 0 and count > 0:
-                count = 0
-
-            elif flag == 1:
-                count = n_samples
-                flag = -1
-
-            # countdown
-            count = count - 1
-
-        if count == 0 and flag == -1:
-            hypoglycemic_events['time_start'] = np.append(hypoglycemic_events['time_start'], temp_start_time)
-            hypoglycemic_events['duration'] = np.append(hypoglycemic_events['duration'], (pd.to_datetime(data.t.values[t - (n_samples - 1)]).to_pydatetime() - temp_start_time).total_seconds() / 60)
-            k += 1
-            flag = 0
-
-    # Manage the case in which the hypoglycemic event has been found (at
-    # least n_samples < th) but the post hypoglycemic window has not finshed
-    # yet.
-    if count > 0 and flag == -1:
-        hypoglycemic_events['time_start'] = np.append(hypoglycemic_events['time_start'], temp_start_time)
-        hypoglycemic_events['duration'] = np.append(hypoglycemic_events['duration'], (pd.to_datetime(data.t.values[t - (n_samples - count - 1)]).to_pydatetime() - temp_start_time).total_seconds() / 60)
-        k += 1
-
-    if count == n_samples and flag == 1:
-        hypoglycemic_events['time_start'] = np.append(hypoglycemic_events['time_start'], temp_start_time)
-        hypoglycemic_events['duration'] = np.append(hypoglycemic_events['duration'], (pd.to_datetime(data.t.values[t]).to_pydatetime() - temp_start_time).total_seconds() / 60 + sample_time)
-        k = k + 1
-
-    for k in range(hypoglycemic_events['time_start'].size):
-        hypoglycemic_events['time_end'] = np.append(hypoglycemic_events['time_end'], hypoglycemic_events['time_start'][k] + timedelta(minutes=hypoglycemic_events['duration'][k]))
-
-    if hypoglycemic_events['duration'].size == 0:
-        hypoglycemic_events['mean_duration'] = np.nan
-    else:
-        hypoglycemic_events['mean_duration'] = np.mean(hypoglycemic_events['duration'])
-    n_days = number_days_of_observation(data)
-    hypoglycemic_events['events_per_week'] = hypoglycemic_events['time_start'].size / n_days * 7
-
-    return hypoglycemic_events
+    return _build_events(data, start_idxs, end_idxs, sample_time)
 
 
 def find_hyperglycemic_events(data, th=180.):
@@ -374,77 +349,17 @@ def find_hyperglycemic_events(data, th=180.):
     if data.glucose.values.size == 0:
         return hyperglycemic_events
 
-    k = 0 #hypoglycemic_event vector current index
+    # Get the sampling time and the number of consecutive samples required to define the start/end of a valid event
     t0 = pd.to_datetime(data.t.values[0]).to_pydatetime()
     t1 = pd.to_datetime(data.t.values[1]).to_pydatetime()
     sample_time = (t1 - t0).total_seconds() / 60
+    n_samples_in = int(np.round(15/sample_time)) #number of consecutive samples required to define a valid event
+    n_samples_out = n_samples_in
 
-    n_samples = int(np.round(15/sample_time)) #number of consecutive samples required to define a valid event
-
-    count = 0 #number of current found consecutive samples
-
-    # state flag -> 0: no event, 1: found a valid hyper event and
-    #               currently in hypo, -1: found a valid hyper event and
-    #               currently not in hyper.
-    flag = 0
-
-    for t in range(data.glucose.values.size):
-
-        if data.glucose.values[t] > th:
-
-            # If it is a new event, reset count and set the hypothetical starting time to the current timestamp
-            if count <= 0:
-                count = 0
-                temp_start_time = pd.to_datetime(data.t.values[t]).to_pydatetime()
-
-            count = min([n_samples, count + 1]) #limit count to n_samples
-
-            # if count touches the "nSamples sample goal" we found a new event
-            if count == n_samples or flag == -1:
-                flag = 1
-
-        else:
-
-            if flag == 0 and count > 0:
-                count = 0
+    # Locate the hyperglycemic events as runs of consecutive samples > th (nan samples are never in event)
+    start_idxs, end_idxs = _find_events(data.glucose.values > th, n_samples_in=n_samples_in, n_samples_out=n_samples_out)
 
-            elif flag == 1:
-                count = n_samples
-                flag = -1
-
-            # countdown
-            count = count - 1
-
-        if count == 0 and flag == -1:
-            hyperglycemic_events['time_start'] = np.append(hyperglycemic_events['time_start'], temp_start_time)
-            hyperglycemic_events['duration'] = np.append(hyperglycemic_events['duration'], (pd.to_datetime(data.t.values[t - (n_samples - 1)]).to_pydatetime() - temp_start_time).total_seconds() / 60)
-            k += 1
-            flag = 0
-
-    # Manage the case in which the hyperglycemic event has been found (at
-    # least n_samples > th) but the post hyperglycemic window has not finshed
-    # yet.
-    if count > 0 and flag == -1:
-        hyperglycemic_events['time_start'] = np.append(hyperglycemic_events['time_start'], temp_start_time)
-        hyperglycemic_events['duration'] = np.append(hyperglycemic_events['duration'], (pd.to_datetime(data.t.values[t - (n_samples - count - 1)]).to_pydatetime() - temp_start_time).total_seconds() / 60)
-        k += 1
-
-    if count == n_samples and flag == 1:
-        hyperglycemic_events['time_start'] = np.append(hyperglycemic_events['time_start'], temp_start_time)
-        hyperglycemic_events['duration'] = np.append(hyperglycemic_events['duration'], (pd.to_datetime(data.t.values[t]).to_pydatetime() - temp_start_time).total_seconds() / 60 + sample_time)
-        k = k + 1
-
-    for k in range(hyperglycemic_events['time_start'].size):
-        hyperglycemic_events['time_end'] = np.append(hyperglycemic_events['time_end'], hyperglycemic_events['time_start'][k] + timedelta(minutes=hyperglycemic_events['duration'][k]))
-
-    if hyperglycemic_events['duration'].size == 0:
-        hyperglycemic_events['mean_duration'] = np.nan
-    else:
-        hyperglycemic_events['mean_duration'] = np.mean(hyperglycemic_events['duration'])
-    n_days = number_days_of_observation(data)
-    hyperglycemic_events['events_per_week'] = hyperglycemic_events['time_start'].size / n_days * 7
-
-    return hyperglycemic_events
+    return _build_events(data, start_idxs, end_idxs, sample_time)
 
 
 def find_extended_hypoglycemic_events(data, th=54.):
@@ -509,78 +424,17 @@ def find_extended_hypoglycemic_events(data, th=54.):
     if data.glucose.values.size == 0:
         return extended_hypoglycemic_events
 
-    k = 0 #hypoglycemic_event vector current index
+    # Get the sampling time and the number of consecutive samples required to define the start/end of a valid event
     t0 = pd.to_datetime(data.t.values[0]).to_pydatetime()
     t1 = pd.to_datetime(data.t.values[1]).to_pydatetime()
     sample_time = (t1 - t0).total_seconds() / 60
-
     n_samples_in = int(np.round(120/sample_time)) #number of consecutive samples required to define the start of a valid event
     n_samples_out = int(np.round(15/ sample_time))  # number of consecutive samples required to define the end of a valid event
 
-    count = 0 #number of current found consecutive samples
-
-    # state flag -> 0: no event, 1: found a valid hypo event and
-    #               currently in hypo, -1: found a valid hypo event and
-    #               currently not in hypo.
-    flag = 0
-
-    for t in range(data.glucose.values.size):
-
-        if data.glucose.values[t] < th:
+    # Locate the extended hypoglycemic events as runs of consecutive samples < th (nan samples are never in event)
+    start_idxs, end_idxs = _find_events(data.glucose.values < th, n_samples_in=n_samples_in, n_samples_out=n_samples_out)
 
-            # If it is a new event, reset count and set the hypothetical starting time to the current timestamp
-            if count <= 0:
-                count = 0
-                temp_start_time = pd.to_datetime(data.t.values[t]).to_pydatetime()
-
-            count = min([n_samples_in, count + 1]) #limit count to n_samples
-
-            # if count touches the "nSamples sample goal" we found a new event
-            if count == n_samples_in or flag == -1:
-                flag = 1
-
-        else:
-
-            if flag == 0 and count > 0:
-                count = 0
-
-            elif flag == 1:
-                count = n_samples_out
-                flag = -1
-
-            # countdown
-            count = count - 1
-
-        if count == 0 and flag == -1:
-            extended_hypoglycemic_events['time_start'] = np.append(extended_hypoglycemic_events['time_start'], temp_start_time)
-            extended_hypoglycemic_events['duration'] = np.append(extended_hypoglycemic_events['duration'], (pd.to_datetime(data.t.values[t - (n_samples_out - 1)]).to_pydatetime() - temp_start_time).total_seconds() / 60)
-            k += 1
-            flag = 0
-
-    # Manage the case in which the hypoglycemic event has been found (at
-    # least n_samples < th) but the post hypoglycemic window has not finshed
-    # yet.
-    if count > 0 and flag == -1:
-        extended_hypoglycemic_events['time_start'] = np.append(extended_hypoglycemic_events['time_start'], temp_start_time)
-        extended_hypoglycemic_events['duration'] = np.append(extended_hypoglycemic_events['duration'], (pd.to_datetime(data.t.values[t - (n_samples_out - count - 1)]).to_pydatetime() - temp_start_time).total_seconds() / 60)
-        k += 1
-
-    if count == n_samples_in and flag == 1:
-        extended_hypoglycemic_events['time_start'] = np.append(extended_hypoglycemic_events['time_start'], temp_start_time)
-        extended_hypoglycemic_events['duration'] = np.append(extended_hypoglycemic_events['duration'], (pd.to_datetime(data.t.values[t]).to_pydatetime() - temp_start_time).total_seconds() / 60 + sample_time)
-        k = k + 1
-
-    for k in range(extended_hypoglycemic_events['time_start'].size):
-        extended_hypoglycemic_events['time_end'] = np.append(extended_hypoglycemic_events['time_end'], extended_hypoglycemic_events['time_start'][k] + timedelta(minutes=extended_hypoglycemic_events['duration'][k]))
-
-    if extended_hypoglycemic_events['duration'].size == 0:
-        extended_hypoglycemic_events['mean_duration'] = np.nan
-    else:
-        extended_hypoglycemic_events['mean_duration'] = np.mean(extended_hypoglycemic_events['duration'])
-    n_days = number_days_of_observation(data)
-    extended_hypoglycemic_events['events_per_week'] = extended_hypoglycemic_events['time_start'].size / n_days * 7
-
-    return extended_hypoglycemic_events
+    return _build_events(data, start_idxs, end_idxs, sample_time)
 
 
 def find_hypoglycemic_events_by_level(data, glycemic_target = 'diabetes'):
@@ -674,14 +528,12 @@ def find_hypoglycemic_events_by_level(data, glycemic_target = 'diabetes'):
     # Get L2 hypoglycemic events
     l2_hypo_events = find_hypoglycemic_events(data, th=th_l2)
 
+    # Flag as l1 the events not containing the start of an l2 event, i.e., not being the last event starting before an
+    # l2 event
     flag_l1_events = np.full((all_hypo_events['time_start'].size,), True)
-
-    for h in range(l2_hypo_events['time_start'].size):
-
-        distances = [(x - l2_hypo_events['time_start'][h]).total_seconds() for x in all_hypo_events['time_start']]
-        idxs = np.where(np.array(distances) < 0)[0]
-        if idxs.size > 0:
-            flag_l1_events[idxs[-1]] = False
+    idxs = np.searchsorted(all_hypo_events['time_start'].astype('datetime64[us]'),
+                           l2_hypo_events['time_start'].astype('datetime64[us]'), side='left') - 1
+    flag_l1_events[idxs[idxs >= 0]] = False
 
     hypoglycemic_events = dict()
     hypoglycemic_events['hypo'] = copy(all_hypo_events)
@@ -788,14 +640,12 @@ def find_hyperglycemic_events_by_level(data, glycemic_target='diabetes'):
     # Get L2 hyperglycemic events
     l2_hyper_events = find_hyperglycemic_events(data, th=th_l2)
 
+    # Flag as l1 the events not containing the start of an l2 event, i.e., not being the last event starting before an
+    # l2 event
     flag_l1_events = np.full((all_hyper_events['time_start'].size,), True)
-
-    for h in range(l2_hyper_events['time_start'].size):
-
-        distances = [(x - l2_hyper_events['time_start'][h]).total_seconds() for x in all_hyper_events['time_start']]
-        idxs = np.where(np.array(distances) < 0)[0]
-        if idxs.size > 0:
-            flag_l1_events[idxs[-1]] = False
+    idxs = np.searchsorted(all_hyper_events['time_start'].astype('datetime64[us]'),
+                           l2_hyper_events['time_start'].astype('datetime64[us]'), side='left') - 1
+    flag_l1_events[idxs[idxs >= 0]] = False
 
     hyperglycemic_events = dict()
     hyperglycemic_events['hyper'] = copy(all_hyper_events)
@@ -809,3 +659,102 @@ def find_hyperglycemic_events_by_level(data, glycemic_target='diabetes'):
     hyperglycemic_events['l2'] = copy(l2_hyper_events)
 
     return hyperglycemic_events
+
+
+def _find_events(flags, n_samples_in, n_samples_out):
+    """
+    Locates the glycemic events in a sequence of flags indicating whether each sample is in the glycemic region of
+    interest. An event starts with at least `n_samples_in` consecutive flagged samples and ends with at least
+    `n_samples_out` consecutive non-flagged samples.
+
+    Parameters
+    ----------
+    flags: np.ndarray
+        A boolean array indicating whether each sample is in the glycemic region of interest.
+    n_samples_in: int
+        The number of consecutive flagged samples required to define the start of a valid event.
+    n_samples_out: int
+        The number of consecutive non-flagged samples required to define the end of a valid event.
+
+    Returns
+    -------
+    start_idxs: np.ndarray
+        The index of the first sample of each event.
+    end_idxs: np.ndarray
+        The index of the first sample following each event (i.e., `flags.size` if the event is still ongoing at the
+        end of the data).
+    """
+    # Locate the runs of consecutive flagged samples
+    edges = np.diff(np.concatenate(([0], flags.view(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+
+    # Group the runs separated by less than n_samples_out non-flagged samples: each group having at least one run
+    # of n_samples_in samples holds an event, starting at that run and ending after the last run of the group
+    group = np.cumsum(np.concatenate(([True], run_starts[1:] - run_ends[:-1] >= n_samples_out)))
+    group_last_runs = np.flatnonzero(np.concatenate((group[1:] != group[:-1], [True])))
+    long_runs = np.flatnonzero(run_ends - run_starts >= n_samples_in)
+    first_long_runs = long_runs[np.concatenate(([True], group[long_runs[1:]] != group[long_runs[:-1]]))[:long_runs.size]]
+    last_runs = group_last_runs[group[first_long_runs] - 1]
+    start_idxs = run_starts[first_long_runs]
+    end_idxs = run_ends[last_runs]
+
+    # An event still ongoing at the end of the data whose last run has been joined after a gap is kept only if the
+    # samples of that run outnumber the missing end samples by at least n_samples_in
+    if end_idxs.size > 0 and end_idxs[-1] == flags.size and last_runs[-1] != first_long_runs[-1]:
+        gap = run_starts[last_runs[-1]] - run_ends[last_runs[-1] - 1]
+        length = run_ends[last_runs[-1]] - run_starts[last_runs[-1]]
+        if n_samples_out - gap + length < n_samples_in:
+            start_idxs = start_idxs[:-1]
+            end_idxs = end_idxs[:-1]
+
+    return start_idxs, end_idxs
+
+
+def _build_events(data, start_idxs, end_idxs, sample_time):
+    """
+    Builds the dictionary describing the glycemic events returned by the find_*_events functions.
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        Pandas dataframe with a column `glucose` containing the glucose data
+        to analyze (in mg/dl) and a column `t` containing their timestamps.
+    start_idxs: np.ndarray
+        The index of the first sample of each event.
+    end_idxs: np.ndarray
+        The index of the first sample following each event (i.e., the number of samples if the event is still ongoing
+        at the end of the data).
+    sample_time: float
+        The sampling time of the data (in minutes).
+
+    Returns
+    -------
+    events: dict
+        A dictionary containing the information on the events with fields `time_start`, `time_end`, `duration`,
+        `mean_duration` and `events_per_week`.
+    """
+    t = data.t.values.astype('datetime64[us]')
+    n = t.size
+
+    # Compute the durations, adding a sample time to the events still ongoing at the end of the data
+    ongoing = end_idxs == n
+    end_times = t[np.where(ongoing, n - 1, end_idxs)]
+    duration = (end_times - t[start_idxs]).astype(np.int64) / 1e6 / 60
+    duration[ongoing] += sample_time
+
+    events = dict()
+    events['time_start'] = np.empty(shape=(start_idxs.size,), dtype=datetime)
+    events['time_start'][:] = pd.to_datetime(t[start_idxs]).to_pydatetime()
+    events['time_end'] = np.empty(shape=(start_idxs.size,), dtype=datetime)
+    for k in range(start_idxs.size):
+        events['time_end'][k] = events['time_start'][k] + timedelta(minutes=duration[k])
+    events['duration'] = duration
+    if duration.size == 0:
+        events['mean_duration'] = np.nan
+    else:
+        events['mean_duration'] = np.mean(duration)
+    n_days = number_days_of_observation(data)
+    events['events_per_week'] = start_idxs.size / n_days * 7
+
+    return events
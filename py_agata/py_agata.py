@@ -1,4 +1,10 @@
+import hashlib
+import threading
+import warnings
 import numpy as np
+from collections import OrderedDict
+from importlib.metadata import version, PackageNotFoundError
+from copy import deepcopy
 from statsmodels.stats.diagnostic import lilliefors
 from scipy.stats import ttest_ind, wilcoxon, mannwhitneyu,ranksums
 
@@ -8,6 +14,16 @@ from py_agata.risk import *
 from py_agata.glycemic_transformation import *
 from py_agata.inspection import *
 
+from py_agata.utils import _glucose_soa
+from py_agata.variability import _basic_stats, _derived_stats, _cogi_from_array, _auc_glucose_over_basal_from_soa, \
+    _conga_from_soa, _mage_kernel, _modd_from_soa, _sddm_index_from_soa, _sdw_index_from_soa, \
+    _std_glucose_roc_from_soa, _cvga_from_soa
+from py_agata.time_in_ranges import _tir_kernel, _glycemic_thresholds
+from py_agata.risk import _risk_kernel
+from py_agata.inspection import _missing_glucose_percentage_from_soa, _number_days_of_observation_from_soa
+from py_agata.glycemic_transformation import _grade_kernel, _igc_from_array, _hypo_index_from_array, \
+    _hyper_index_from_array, _mr_index_from_array
+
 class Agata:
     """
     Core class of AGATA.
@@ -17,6 +33,13 @@ class Agata:
     ----------
     glycemic_target: str
         A string defining the set of glycemic targets to use.
+    cache_dir: str or None
+        The directory where the results of analyze_glucose_profile are persisted across sessions (requires joblib).
+        Persisted results are indexed by the installed version of py_agata, so results computed by a different
+        version are never reused. If None, results are cached in memory only.
+    results_cache_enabled: bool
+        Switch of the results caches of analyze_glucose_profile (both in memory and on disk). If False, the results
+        are always recomputed. Defaults to True; set it on the class to disable the caches for all the instances.
 
     Methods
     -------
@@ -24,12 +47,38 @@ class Agata:
         Runs ReplayBG.
     """
 
-    def __init__(self, glycemic_target='diabetes'):
+    # Results of analyze_glucose_profile shared by all the instances, indexed by profile and glycemic target.
+    # Profiles smaller than _RESULTS_CACHE_MIN_NBYTES are cheap enough to be recomputed.
+    results_cache_enabled = True
+    _results_cache = OrderedDict()
+    _results_cache_lock = threading.Lock()
+    _RESULTS_CACHE_MAX_SIZE = 128
+    _RESULTS_CACHE_MIN_NBYTES = 4096
+
+    def __init__(self, glycemic_target='diabetes', cache_dir=None):
         self.glycemic_target = glycemic_target
+        self.cache_dir = cache_dir
+
+        # Persist the results on disk, if requested. The version of py_agata is part of the key of the persisted
+        # results, so that they are recomputed whenever the metrics code changes.
+        self._disk_cache = None
+        self._package_version = None
+        if cache_dir is not None:
+            try:
+                self._package_version = version('py_agata')
+            except PackageNotFoundError:
+                warnings.warn('The version of py_agata cannot be determined (is it installed?): results will not be '
+                              'persisted in `cache_dir`.')
+            else:
+                from joblib import Memory
+                self._disk_cache = Memory(location=cache_dir, verbose=0).cache(_analyze_glucose_profile_cached,
+                                                                               ignore=['data'])
 
     def analyze_glucose_profile(self, data):
         """
-        Analyzes a single glucose profile.
+        Analyzes a single glucose profile. The results of large profiles are cached in memory, so that analyzing
+        again the same profile with the same glycemic target returns a copy of the previous results. If `cache_dir`
+        has been given, the results are also persisted there and reused across sessions.
 
         Parameters
         ----------
@@ -75,75 +124,229 @@ class Agata:
         check_data_columns(data)
         check_homogeneous_timegrid(data)
 
-        results = dict()
-
-        # Get variability metrics
-        results['variability'] = dict()
-        results['variability']['mean_glucose'] = mean_glucose(data)
-        results['variability']['median_glucose'] = median_glucose(data)
-        results['variability']['std_glucose'] = std_glucose(data)
-        results['variability']['cv_glucose'] = cv_glucose(data)
-        results['variability']['range_glucose'] = range_glucose(data)
-        results['variability']['iqr_glucose'] = iqr_glucose(data)
-        results['variability']['auc_glucose'] = auc_glucose(data)
-        results['variability']['gmi'] = gmi(data)
-        results['variability']['cogi'] = cogi(data)
-        results['variability']['conga'] = conga(data)
-        results['variability']['j_index'] = j_index(data)
-        results['variability']['mage_plus_index'] = mage_plus_index(data)
-        results['variability']['mage_minus_index'] = mage_minus_index(data)
-        results['variability']['mage_index'] = mage_index(data)
-        results['variability']['ef_index'] = ef_index(data)
-        results['variability']['modd'] = modd(data)
-        results['variability']['sddm_index'] = sddm_index(data)
-        results['variability']['sdw_index'] = sdw_index(data)
-        results['variability']['std_glucose_roc'] = std_glucose_roc(data)
-        results['variability']['cvga'] = cvga(data)
-
-        # Get time metrics
-        results['time_in_ranges'] = dict()
-        results['time_in_ranges']['time_in_target'] = time_in_target(data, self.glycemic_target)
-        results['time_in_ranges']['time_in_tight_target'] = time_in_tight_target(data, self.glycemic_target)
-        results['time_in_ranges']['time_in_hypoglycemia'] = time_in_hypoglycemia(data, self.glycemic_target)
-        results['time_in_ranges']['time_in_l1_hypoglycemia'] = time_in_l1_hypoglycemia(data, self.glycemic_target)
-        results['time_in_ranges']['time_in_l2_hypoglycemia'] = time_in_l2_hypoglycemia(data, self.glycemic_target)
-        results['time_in_ranges']['time_in_hyperglycemia'] = time_in_hyperglycemia(data, self.glycemic_target)
-        results['time_in_ranges']['time_in_l1_hyperglycemia'] = time_in_l1_hyperglycemia(data, self.glycemic_target)
-        results['time_in_ranges']['time_in_l2_hyperglycemia'] = time_in_l2_hyperglycemia(data, self.glycemic_target)
-
-        # Get risk metrics
-        results['risk'] = dict()
-        results['risk']['adrr'] = adrr(data)
-        results['risk']['lbgi'] = lbgi(data)
-        results['risk']['hbgi'] = hbgi(data)
-        results['risk']['bgri'] = bgri(data)
-        results['risk']['gri'] = gri(data)
-
-        # Get glycemic transformation metrics
-        results['glycemic_transformation'] = dict()
-        results['glycemic_transformation']['grade_score'] = grade_score(data)
-        results['glycemic_transformation']['grade_hypo_score'] = grade_hypo_score(data)
-        results['glycemic_transformation']['grade_hyper_score'] = grade_hyper_score(data)
-        results['glycemic_transformation']['grade_eu_score'] = grade_eu_score(data)
-        results['glycemic_transformation']['igc'] = igc(data)
-        results['glycemic_transformation']['hypo_index'] = hypo_index(data)
-        results['glycemic_transformation']['hyper_index'] = hyper_index(data)
-        results['glycemic_transformation']['mr_index'] = mr_index(data)
-
-        # Event metrics
-        results['events'] = dict()
-        results['events']['hypoglycemic_events'] = find_hypoglycemic_events_by_level(data, glycemic_target=self.glycemic_target)
-        results['events']['hyperglycemic_events'] = find_hyperglycemic_events_by_level(data, glycemic_target=self.glycemic_target)
-        results['events']['extended_hypoglycemic_events'] = find_extended_hypoglycemic_events(data)
-
-        # Data quality metrics
-        results['data_quality'] = dict()
-        results['data_quality']['number_days_of_observation'] = number_days_of_observation(data)
-        results['data_quality']['missing_glucose_percentage'] = missing_glucose_percentage(data)
+        # Return a copy of the cached results if the same profile has already been analyzed
+        key = self._results_cache_key(data)
+        if key is not None:
+            with Agata._results_cache_lock:
+                cached = Agata._results_cache.get(key)
+                if cached is not None:
+                    Agata._results_cache.move_to_end(key)
+            if cached is not None:
+                return deepcopy(cached)
+
+        if key is not None and self._disk_cache is not None:
+            results = self._disk_cache(key[0], self.glycemic_target, self._package_version, data)
+        else:
+            results = self._analyze_glucose_profile(data)
+
+        # Cache the results (discarding the least recently used ones)
+        if key is not None:
+            cached = deepcopy(results)
+            with Agata._results_cache_lock:
+                Agata._results_cache[key] = cached
+                if len(Agata._results_cache) > Agata._RESULTS_CACHE_MAX_SIZE:
+                    Agata._results_cache.popitem(last=False)
 
         # Return results
         return results
 
+    def _results_cache_key(self, data):
+        """
+        Computes the key identifying the analysis of a glucose profile in the results cache, i.e., a digest of the
+        glucose and timestamp buffers together with the glycemic target.
+
+        Parameters
+        ----------
+        data: pd.DataFrame
+            Pandas dataframe with a column `glucose` containing the glucose data to analyze (in mg/dl).
+
+        Returns
+        -------
+        key: tuple or None
+            The cache key, or None if the profile should not be cached.
+        """
+        if not self.results_cache_enabled:
+            return None
+
+        glucose = np.ascontiguousarray(data.glucose.values)
+        t = np.ascontiguousarray(data.t.values)
+
+        # Skip small profiles and the ones that cannot be hashed as raw buffers
+        if glucose.nbytes < Agata._RESULTS_CACHE_MIN_NBYTES or glucose.dtype.kind != 'f' or t.dtype.kind != 'M':
+            return None
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(glucose.dtype.str.encode())
+        digest.update(glucose.view(np.uint8))
+        digest.update(t.dtype.str.encode())
+        digest.update(t.view(np.uint8))
+        return digest.digest(), self.glycemic_target
+
+    def _analyze_glucose_profile(self, data):
+        """
+        Computes the metrics of analyze_glucose_profile on already validated data.
+
+        Parameters
+        ----------
+        data: pd.DataFrame
+            Pandas dataframe with a column `glucose` containing the glucose data to analyze (in mg/dl).
+
+        Returns
+        -------
+        results: dict
+            A dictionary containing the results of the analysis (see analyze_glucose_profile).
+        """
+        # Extract the arrays of the profile once and share them among the metric groups
+        soa = _glucose_soa(data)
+
+        results = dict()
+        results['variability'] = self._variability_metrics(soa)
+        results['time_in_ranges'] = self._time_in_ranges_metrics(soa)
+        results['risk'] = self._risk_metrics(soa)
+        results['glycemic_transformation'] = self._glycemic_transformation_metrics(soa)
+        results['events'] = self._event_metrics(data)
+        results['data_quality'] = self._data_quality_metrics(soa)
+
+        return results
+
+    def _variability_metrics(self, soa):
+        """
+        Computes the variability metrics of analyze_glucose_profile.
+
+        Parameters
+        ----------
+        soa: _GlucoseSoA
+            The arrays of the glucose profile (see py_agata.utils._glucose_soa).
+
+        Returns
+        -------
+        results: dict
+            A dictionary containing the values of the metrics of the group.
+        """
+        values = soa.values
+
+        # Scratch buffer shared by the metrics based on lagged glucose differences
+        scratch = np.empty(shape=(soa.glucose.size,))
+
+        # Get variability metrics (the descriptive ones all derive from the same basic statistics)
+        stats = _basic_stats(values)
+        derived_stats = _derived_stats(stats)
+        variability = dict()
+        variability['mean_glucose'] = stats['mean']
+        variability['median_glucose'] = stats['median']
+        variability['std_glucose'] = stats['std']
+        variability['cv_glucose'] = derived_stats['cv_glucose']
+        variability['range_glucose'] = stats['max'] - stats['min']
+        variability['iqr_glucose'] = stats['q3'] - stats['q1']
+        variability['auc_glucose'] = _auc_glucose_over_basal_from_soa(soa, 0.)
+        variability['gmi'] = derived_stats['gmi']
+        variability['cogi'] = _cogi_from_array(values)
+        variability['conga'] = _conga_from_soa(soa, out=scratch)
+        variability['j_index'] = derived_stats['j_index']
+        variability.update(_mage_kernel(soa))
+        variability['modd'] = _modd_from_soa(soa, out=scratch)
+        variability['sddm_index'] = _sddm_index_from_soa(soa)
+        variability['sdw_index'] = _sdw_index_from_soa(soa)
+        variability['std_glucose_roc'] = _std_glucose_roc_from_soa(soa)
+        variability['cvga'] = _cvga_from_soa(soa)
+
+        return variability
+
+    def _time_in_ranges_metrics(self, soa):
+        """
+        Computes the time in ranges metrics of analyze_glucose_profile.
+
+        Parameters
+        ----------
+        soa: _GlucoseSoA
+            The arrays of the glucose profile (see py_agata.utils._glucose_soa).
+
+        Returns
+        -------
+        results: dict
+            A dictionary containing the values of the metrics of the group.
+        """
+        return _tir_kernel(soa.values, _glycemic_thresholds(self.glycemic_target))
+
+    def _risk_metrics(self, soa):
+        """
+        Computes the risk metrics of analyze_glucose_profile.
+
+        Parameters
+        ----------
+        soa: _GlucoseSoA
+            The arrays of the glucose profile (see py_agata.utils._glucose_soa).
+
+        Returns
+        -------
+        results: dict
+            A dictionary containing the values of the metrics of the group.
+        """
+        return _risk_kernel(soa)
+
+    def _glycemic_transformation_metrics(self, soa):
+        """
+        Computes the glycemic transformation metrics of analyze_glucose_profile.
+
+        Parameters
+        ----------
+        soa: _GlucoseSoA
+            The arrays of the glucose profile (see py_agata.utils._glucose_soa).
+
+        Returns
+        -------
+        results: dict
+            A dictionary containing the values of the metrics of the group.
+        """
+        glycemic_transformation = _grade_kernel(soa.values)
+        glycemic_transformation['igc'] = _igc_from_array(soa.values)
+        glycemic_transformation['hypo_index'] = _hypo_index_from_array(soa.values)
+        glycemic_transformation['hyper_index'] = _hyper_index_from_array(soa.values)
+        glycemic_transformation['mr_index'] = _mr_index_from_array(soa.values)
+
+        return glycemic_transformation
+
+    def _event_metrics(self, data):
+        """
+        Computes the event metrics of analyze_glucose_profile.
+
+        Parameters
+        ----------
+        data: pd.DataFrame
+            Pandas dataframe with a column `glucose` containing the glucose data to analyze (in mg/dl).
+
+        Returns
+        -------
+        results: dict
+            A dictionary containing the values of the metrics of the group.
+        """
+        events = dict()
+        events['hypoglycemic_events'] = find_hypoglycemic_events_by_level(data, glycemic_target=self.glycemic_target)
+        events['hyperglycemic_events'] = find_hyperglycemic_events_by_level(data, glycemic_target=self.glycemic_target)
+        events['extended_hypoglycemic_events'] = find_extended_hypoglycemic_events(data)
+
+        return events
+
+    def _data_quality_metrics(self, soa):
+        """
+        Computes the data quality metrics of analyze_glucose_profile.
+
+        Parameters
+        ----------
+        soa: _GlucoseSoA
+            The arrays of the glucose profile (see py_agata.utils._glucose_soa).
+
+        Returns
+        -------
+        results: dict
+            A dictionary containing the values of the metrics of the group.
+        """
+        data_quality = dict()
+        data_quality['number_days_of_observation'] = _number_days_of_observation_from_soa(soa)
+        data_quality['missing_glucose_percentage'] = _missing_glucose_percentage_from_soa(soa)
+
+        return data_quality
+
     def analyze_one_arm(self, data):
         """
         Analyzes glucose data of one arm.
@@ -910,3 +1113,27 @@ class Agata:
                         stats["events"]["extended_hypoglycemic_events"][m]["h"] = 1 * (t.pvalue < alpha)
 
         return results, stats
+
+
+def _analyze_glucose_profile_cached(digest, glycemic_target, package_version, data):
+    """
+    Computes the metrics of analyze_glucose_profile on already validated data. Used as the function persisted by the
+    on-disk results cache, which indexes its results by `digest`, `glycemic_target` and `package_version` only.
+
+    Parameters
+    ----------
+    digest: bytes
+        The digest of the glucose and timestamp buffers of `data` (see Agata._results_cache_key).
+    glycemic_target: str
+        A string defining the set of glycemic targets to use.
+    package_version: str
+        The version of py_agata computing the results.
+    data: pd.DataFrame
+        Pandas dataframe with a column `glucose` containing the glucose data to analyze (in mg/dl).
+
+    Returns
+    -------
+    results: dict
+        A dictionary containing the results of the analysis (see Agata.analyze_glucose_profile).
+    """
+    return Agata(glycemic_target=glycemic_target)._analyze_glucose_profile(data)
@@ -1,8 +1,8 @@
 import numpy as np
 import pandas as pd
-from datetime import datetime,timedelta
 
-from py_agata.time_in_ranges import time_in_l1_hypoglycemia, time_in_l2_hypoglycemia, time_in_l1_hyperglycemia, time_in_l2_hyperglycemia
+from py_agata.time_in_ranges import _time_in_l1_hypoglycemia_from_array, _time_in_l2_hypoglycemia_from_array, \
+    _time_in_l1_hyperglycemia_from_array, _time_in_l2_hyperglycemia_from_array
 from py_agata.input_validator import *
 
 def adrr(data):
@@ -45,56 +45,78 @@ def adrr(data):
     if data.t.values.size == 0:
         return np.nan
 
+    # Get rid of nans
+    flags = ~np.isnan(data.glucose.values)
+
+    # Risk computation
+    rl, rh = _bg_risk(data.glucose.values[flags])
+
+    # Return adrr
+    return _adrr_from_risk(rl, rh, data.t.values[flags])
+
+
+def _bg_risk(non_nan_glucose):
+    """
+    Computes the low and high blood glucose risk of each of the given non-nan glucose values, i.e., the squared
+    Kovatchev symmetrization of glucose split into its hypoglycemic and hyperglycemic contributions.
+
+    Parameters
+    ----------
+    non_nan_glucose: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    rl: np.ndarray
+        The low blood glucose risk of each value.
+    rh: np.ndarray
+        The high blood glucose risk of each value.
+    """
     # Setup the formula parameters
     alpha = 1.084
     beta = 5.381
     gamma = 1.509
     th = 112.5
 
-    # Get the first and last day limits
-    first_day = pd.to_datetime(data.t.values[0]).to_pydatetime()
-    first_day = first_day.replace(hour=0, minute=0, second=0)
-    last_day = pd.to_datetime(data.t.values[-1]).to_pydatetime()
-    last_day = last_day.replace(day=last_day.day+1,hour=0, minute=0, second=0)
-
-    # Calculate the number of days and preallocate the daily max lbgi and hbgi
-    n_days = (last_day-first_day).days
-    max_lbgi_day = np.empty(shape=(n_days,))
-    max_hbgi_day = np.empty(shape=(n_days,))
-
-    for d in range(0,n_days):
-
-        # Get the day of data
-        low_limit = data.t >= (first_day + timedelta(days=d))
-        high_limit = data.t < (first_day + timedelta(days=d+1))
-        flags = np.logical_and(low_limit,high_limit)
-        day_data = data.glucose.values[flags]
+    # Symmetrization
+    f = gamma*(np.log(non_nan_glucose)**alpha-beta)
 
-        # Get rid of nans
-        non_nan_glucose = day_data[~np.isnan(day_data)]
+    # Risk computation
+    r = 10*(f**2)
+    rl = np.where(non_nan_glucose > th, 0, r)
+    rh = np.where(non_nan_glucose < th, 0, r)
 
-        if not non_nan_glucose.size == 0:
+    return rl, rh
 
-            # Symmetrization
-            f = gamma*(np.log(non_nan_glucose)**alpha-beta)
 
-            # Risk computation
-            rl = 10*(f**2)
-            rl[non_nan_glucose > th] = 0
-            rh = 10*(f**2)
-            rh[non_nan_glucose < th] = 0
+def _adrr_from_risk(rl, rh, t):
+    """
+    Computes the average daily risk range (ADRR) from the low and high blood glucose risk of non-nan glucose values.
 
-            # Get the max risks
-            max_lbgi_day[d] = np.max(rl)
-            max_hbgi_day[d] = np.max(rh)
+    Parameters
+    ----------
+    rl: np.ndarray
+        The low blood glucose risk of each non-nan glucose value.
+    rh: np.ndarray
+        The high blood glucose risk of each non-nan glucose value.
+    t: np.ndarray
+        The sorted np.datetime64 timestamps of each non-nan glucose value.
 
-        else:
+    Returns
+    -------
+    adrr: float
+        the average daily risk range of the glucose concentration.
+    """
+    # Return nan if all values are nan
+    if rl.size == 0:
+        return np.nan
 
-            max_hbgi_day[d] = np.nan
-            max_lbgi_day[d] = np.nan
+    # Locate the first sample of each day having data
+    days = t.astype('datetime64[D]')
+    day_starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
 
-    # Return adrr
-    return np.nanmean(max_hbgi_day + max_lbgi_day)
+    # Return the mean of the daily max risks
+    return np.mean(np.maximum.reduceat(rl, day_starts) + np.maximum.reduceat(rh, day_starts))
 
 
 def lbgi(data):
@@ -134,21 +156,29 @@ def lbgi(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Setup the formula parameters
-    alpha = 1.084
-    beta = 5.381
-    gamma = 1.509
-    th = 112.5
-
     # Get rid of nans
     non_nan_glucose = data.glucose.values[~np.isnan(data.glucose.values)]
 
-    # Symmetrization
-    f = gamma*(np.log(non_nan_glucose)**alpha-beta)
+    # Return lbgi
+    return _lbgi_from_array(non_nan_glucose)
+
 
+def _lbgi_from_array(non_nan_glucose):
+    """
+    Computes the low blood glucose index (LBGI) of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    non_nan_glucose: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    lbgi: float
+        the low blood glucose index of the glucose concentration.
+    """
     # Risk computation
-    rl = 10*(f**2)
-    rl[non_nan_glucose > th] = 0
+    rl, rh = _bg_risk(non_nan_glucose)
 
     # Return lbgi
     return np.mean(rl)
@@ -191,21 +221,29 @@ def hbgi(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Setup the formula parameters
-    alpha = 1.084
-    beta = 5.381
-    gamma = 1.509
-    th = 112.5
-
     # Get rid of nans
     non_nan_glucose = data.glucose.values[~np.isnan(data.glucose.values)]
 
-    # Symmetrization
-    f = gamma*(np.log(non_nan_glucose)**alpha-beta)
+    # Return hbgi
+    return _hbgi_from_array(non_nan_glucose)
+
+
+def _hbgi_from_array(non_nan_glucose):
+    """
+    Computes the high blood glucose index (HBGI) of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    non_nan_glucose: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
 
+    Returns
+    -------
+    hbgi: float
+        the high blood glucose index of the glucose concentration.
+    """
     # Risk computation
-    rh = 10*(f**2)
-    rh[non_nan_glucose < th] = 0
+    rl, rh = _bg_risk(non_nan_glucose)
 
     # Return hbgi
     return np.mean(rh)
@@ -248,8 +286,29 @@ def bgri(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
+    # Get rid of nans
+    non_nan_glucose = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return bgri
+    return _bgri_from_array(non_nan_glucose)
+
+
+def _bgri_from_array(non_nan_glucose):
+    """
+    Computes the blood glucose risk index (BGRI) of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    non_nan_glucose: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    bgri: float
+        the blood glucose risk index of the glucose concentration.
+    """
     # Return bgri
-    return lbgi(data) + hbgi(data)
+    return _lbgi_from_array(non_nan_glucose) + _hbgi_from_array(non_nan_glucose)
 
 
 def gri(data):
@@ -291,11 +350,32 @@ def gri(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
+    # Get rid of nans
+    non_nan_glucose = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return gri
+    return _gri_from_array(non_nan_glucose)
+
+
+def _gri_from_array(non_nan_glucose):
+    """
+    Computes the glycemia risk index (GRI) of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    non_nan_glucose: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    gri: float
+        the glycemia risk index of the glucose concentration.
+    """
     #Compute metric
-    v_low = time_in_l2_hypoglycemia(data) # VLow( < 54 mg / dL; < 3.0 mmol / L)
-    low = time_in_l1_hypoglycemia(data) # Low(54–70 mg / dL; 3.0–3.9 mmol / L)
-    v_high = time_in_l2_hyperglycemia(data) # VHigh( > 250 mg / dL; > 13.9 mmol / L)
-    high = time_in_l1_hyperglycemia(data) # High( > 180–250 mg / dL; > 10.0–13.9 mmol / L)
+    v_low = _time_in_l2_hypoglycemia_from_array(non_nan_glucose) # VLow( < 54 mg / dL; < 3.0 mmol / L)
+    low = _time_in_l1_hypoglycemia_from_array(non_nan_glucose) # Low(54–70 mg / dL; 3.0–3.9 mmol / L)
+    v_high = _time_in_l2_hyperglycemia_from_array(non_nan_glucose) # VHigh( > 250 mg / dL; > 13.9 mmol / L)
+    high = _time_in_l1_hyperglycemia_from_array(non_nan_glucose) # High( > 180–250 mg / dL; > 10.0–13.9 mmol / L)
 
     gri = (3.0 * v_low) + (2.4 * low) + (1.6 * v_high) + (0.8 * high)
 
@@ -303,6 +383,34 @@ def gri(data):
     return np.min([gri, 100])
 
 
+def _risk_kernel(soa):
+    """
+    Computes all the risk metrics of analyze_glucose_profile at once, sharing the blood glucose risk computation
+    among LBGI, HBGI, BGRI and ADRR.
+
+    Parameters
+    ----------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile (see py_agata.utils._glucose_soa).
+
+    Returns
+    -------
+    risk: dict
+        A dictionary with fields `adrr`, `lbgi`, `hbgi`, `bgri` and `gri`.
+    """
+    # Risk computation
+    rl, rh = _bg_risk(soa.values)
+
+    risk = dict()
+    risk['adrr'] = _adrr_from_risk(rl, rh, soa.t[~soa.nan_mask])
+    risk['lbgi'] = np.mean(rl)
+    risk['hbgi'] = np.mean(rh)
+    risk['bgri'] = risk['lbgi'] + risk['hbgi']
+    risk['gri'] = _gri_from_array(soa.values)
+
+    return risk
+
+
 def dynamic_risk(data, amplification_function='tanh', maximum_amplification=2.5, amplification_rapidity=2., maximum_damping=0.6):
     """
     Computes the dynamic risk of the glucose concentration (ignoring nan values).
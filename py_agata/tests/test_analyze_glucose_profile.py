@@ -1,9 +1,13 @@
+import os
+import tempfile
+import pytest
 import pandas as pd
 import numpy as np
 import datetime
 from datetime import datetime, timedelta
 
 from py_agata.py_agata import Agata
+from py_agata.variability import mean_glucose, std_glucose, cv_glucose, gmi, j_index
 
 
 def test_analyze_glucose_profile():
@@ -179,3 +183,179 @@ def test_analyze_glucose_profile():
     assert type(results['events']['hypoglycemic_events']) is dict
     assert type(results['events']['hyperglycemic_events']) is dict
     assert type(results['events']['extended_hypoglycemic_events']) is dict
+
+
+def test_analyze_glucose_profile_cache(monkeypatch):
+    """
+    Unit test of the results cache of Agata.analyze_glucose_profile function.
+
+    Parameters
+    ----------
+    monkeypatch: pytest.MonkeyPatch
+        The pytest fixture used to disable the results cache.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+
+    See Also
+    --------
+    None
+
+    Examples
+    --------
+    None
+
+    References
+    ----------
+    None
+    """
+    # Set test data (large enough to be cached)
+    t = np.arange(datetime(2000, 1, 1, 0, 0, 0), datetime(2000, 1, 3, 0, 0, 0), timedelta(minutes=5)).astype(
+        datetime)
+    glucose = 140 + 100 * np.sin(np.arange(t.shape[0]) / 10)
+    glucose[100:110] = np.nan
+    d = {'t': t, 'glucose': glucose}
+    data = pd.DataFrame(data=d)
+
+    # Tests
+    agata = Agata(glycemic_target='diabetes')
+    results = agata.analyze_glucose_profile(data=data)
+    expected_tir = results['time_in_ranges']['time_in_target']
+    results['time_in_ranges']['time_in_target'] = -1
+
+    # Cached results must be equal to the computed ones and not affected by changes to the returned ones
+    results_cached = Agata(glycemic_target='diabetes').analyze_glucose_profile(data=data)
+    assert results_cached['time_in_ranges']['time_in_target'] == expected_tir
+    assert results_cached['variability']['mean_glucose'] == results['variability']['mean_glucose']
+
+    # A different glycemic target must not hit the cache
+    results_pregnancy = Agata(glycemic_target='pregnancy').analyze_glucose_profile(data=data)
+    assert results_pregnancy['time_in_ranges']['time_in_target'] != expected_tir
+
+    # A different profile must not hit the cache
+    data.loc[0, 'glucose'] = 400
+    results_changed = agata.analyze_glucose_profile(data=data)
+    assert results_changed['variability']['range_glucose'] != results['variability']['range_glucose']
+
+    # Nothing must be cached when the cache is disabled, either on the instance or on the class
+    Agata._results_cache.clear()
+    agata.results_cache_enabled = False
+    results_disabled = agata.analyze_glucose_profile(data=data)
+    assert len(Agata._results_cache) == 0
+    assert results_disabled['variability']['range_glucose'] == results_changed['variability']['range_glucose']
+
+    monkeypatch.setattr(Agata, 'results_cache_enabled', False)
+    Agata(glycemic_target='diabetes').analyze_glucose_profile(data=data)
+    assert len(Agata._results_cache) == 0
+
+
+def test_analyze_glucose_profile_single_metrics():
+    """
+    Unit test of the agreement between Agata.analyze_glucose_profile and the single-metric functions.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+
+    See Also
+    --------
+    None
+
+    Examples
+    --------
+    None
+
+    References
+    ----------
+    None
+    """
+    # Set test data
+    t = np.arange(datetime(2000, 1, 1, 0, 0, 0), datetime(2000, 1, 1, 0, 0, 0) + timedelta(minutes=5 * 20000),
+                  timedelta(minutes=5)).astype(datetime)
+    glucose = 150 + 60 * np.sin(np.arange(t.shape[0]) / 30) + np.random.default_rng(2).normal(0, 10, t.shape[0])
+    d = {'t': t, 'glucose': glucose}
+    data = pd.DataFrame(data=d)
+
+    # Tests (the metrics must be identical however they are requested)
+    results = Agata(glycemic_target='diabetes').analyze_glucose_profile(data=data)
+    assert results['variability']['mean_glucose'] == mean_glucose(data)
+    assert results['variability']['std_glucose'] == std_glucose(data)
+    assert results['variability']['cv_glucose'] == cv_glucose(data)
+    assert results['variability']['gmi'] == gmi(data)
+    assert results['variability']['j_index'] == j_index(data)
+
+
+def test_analyze_glucose_profile_disk_cache(monkeypatch):
+    """
+    Unit test of the on-disk results cache of Agata.analyze_glucose_profile function.
+
+    Parameters
+    ----------
+    monkeypatch: pytest.MonkeyPatch
+        The pytest fixture used to set the version of py_agata.
+
+    Returns
+    -------
+    None
+
+    Raises
+    ------
+    None
+
+    See Also
+    --------
+    None
+
+    Examples
+    --------
+    None
+
+    References
+    ----------
+    None
+    """
+    pytest.importorskip('joblib')
+    monkeypatch.setattr('py_agata.py_agata.version', lambda package: '1.0.0')
+
+    # Set test data (large enough to be cached)
+    t = np.arange(datetime(2000, 1, 1, 0, 0, 0), datetime(2000, 1, 3, 0, 0, 0), timedelta(minutes=5)).astype(
+        datetime)
+    glucose = 150 + 90 * np.cos(np.arange(t.shape[0]) / 12)
+    d = {'t': t, 'glucose': glucose}
+    data = pd.DataFrame(data=d)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+
+        # Tests
+        results = Agata(glycemic_target='diabetes', cache_dir=cache_dir).analyze_glucose_profile(data=data)
+        assert len(os.listdir(cache_dir)) > 0
+
+        # Persisted results must be equal to the computed ones, also when the in-memory cache is empty
+        Agata._results_cache.clear()
+        results_cached = Agata(glycemic_target='diabetes', cache_dir=cache_dir).analyze_glucose_profile(data=data)
+        assert results_cached['variability'] == results['variability']
+        assert results_cached['time_in_ranges'] == results['time_in_ranges']
+
+        # A different glycemic target must not hit the cache
+        results_pregnancy = Agata(glycemic_target='pregnancy', cache_dir=cache_dir).analyze_glucose_profile(data=data)
+        assert results_pregnancy['time_in_ranges']['time_in_target'] != results['time_in_ranges']['time_in_target']
+
+        # A different version of py_agata must not reuse the persisted results
+        Agata._results_cache.clear()
+        n_persisted = sum(len(files) for _, _, files in os.walk(cache_dir))
+        monkeypatch.setattr('py_agata.py_agata.version', lambda package: '1.0.1')
+        Agata(glycemic_target='diabetes', cache_dir=cache_dir).analyze_glucose_profile(data=data)
+        assert sum(len(files) for _, _, files in os.walk(cache_dir)) > n_persisted
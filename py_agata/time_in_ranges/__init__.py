@@ -1,7 +1,40 @@
 import numpy as np
+from types import MappingProxyType
 
 from py_agata.input_validator import *
 
+# The glycemic thresholds (in mg/dl) of each set of glycemic targets
+_GLYCEMIC_TARGETS = {
+    'diabetes': {'l2_hypo': 54., 'hypo': 70., 'tight_low': 70., 'tight_high': 140., 'hyper': 180., 'l2_hyper': 250.},
+    'pregnancy': {'l2_hypo': 54., 'hypo': 63., 'tight_low': 70., 'tight_high': 140., 'hyper': 140., 'l2_hyper': 250.},
+}
+
+
+def _glycemic_thresholds(glycemic_target):
+    """
+    Resolves a set of glycemic targets into its glycemic thresholds.
+
+    Parameters
+    ----------
+    glycemic_target: str, {'diabetes', 'pregnancy'}
+        A string defining the set of glycemic targets to use.
+
+    Returns
+    -------
+    thresholds: MappingProxyType
+        A read-only mapping with fields `l2_hypo`, `hypo`, `tight_low`, `tight_high`, `hyper` and `l2_hyper` containing the
+        glycemic thresholds (in mg/dl).
+
+    Raises
+    ------
+    RuntimeError
+        If `glycemic_target` is not `diabetes` or `pregnancy`.
+    """
+    if glycemic_target not in _GLYCEMIC_TARGETS:
+        raise RuntimeError('`glycemic_target` can be `diabetes` or `pregnancy`.')
+    return MappingProxyType(_GLYCEMIC_TARGETS[glycemic_target])
+
+
 def time_in_target(data, glycemic_target='diabetes'):
     """
     Computes the time spent in the target range (ignoring nan values).
@@ -43,18 +76,36 @@ def time_in_target(data, glycemic_target='diabetes'):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Set the threshold
-    if glycemic_target == 'diabetes':
-        th_l = 70.
-        th_h = 180.
-    elif glycemic_target == 'pregnancy':
-        th_l = 63.
-        th_h = 140.
-    else:
-        raise RuntimeError('`glycemic_target` can be `diabetes` or `pregnancy`.')
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return the result
+    return _time_in_target_from_array(values, _glycemic_thresholds(glycemic_target))
+
+
+def _time_in_target_from_array(values, thresholds=None):
+    """
+    Computes the time spent in the target range of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    thresholds: Mapping or None, optional, default: None
+        The glycemic thresholds to use, as returned by _glycemic_thresholds. If None, the thresholds of the `diabetes`
+        glycemic targets are used.
+
+    Returns
+    -------
+    time_in_target: float
+        The time percentage spent in target range.
+    """
+    if thresholds is None:
+        thresholds = _glycemic_thresholds('diabetes')
 
     # Return the result
-    return time_in_given_range(data=data, th_l=th_l, th_h=th_h, include_th_l=False, include_th_h=False)
+    return _time_in_given_range_from_array(values=values, th_l=thresholds['hypo'], th_h=thresholds['hyper'],
+                                           include_th_l=False, include_th_h=False)
 
 
 def time_in_tight_target(data, glycemic_target='diabetes'):
@@ -98,18 +149,36 @@ def time_in_tight_target(data, glycemic_target='diabetes'):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Set the threshold
-    if glycemic_target == 'diabetes':
-        th_l = 70.
-        th_h = 140.
-    elif glycemic_target == 'pregnancy':
-        th_l = 70.
-        th_h = 140.
-    else:
-        raise RuntimeError('`glycemic_target` can be `diabetes` or `pregnancy`.')
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return the result
+    return _time_in_tight_target_from_array(values, _glycemic_thresholds(glycemic_target))
+
+
+def _time_in_tight_target_from_array(values, thresholds=None):
+    """
+    Computes the time spent in the tight target range of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    thresholds: Mapping or None, optional, default: None
+        The glycemic thresholds to use, as returned by _glycemic_thresholds. If None, the thresholds of the `diabetes`
+        glycemic targets are used.
+
+    Returns
+    -------
+    time_in_tight_target: float
+        The time percentage spent in tight target range.
+    """
+    if thresholds is None:
+        thresholds = _glycemic_thresholds('diabetes')
 
     # Return the result
-    return time_in_given_range(data=data, th_l=th_l, th_h=th_h, include_th_l=False, include_th_h=False)
+    return _time_in_given_range_from_array(values=values, th_l=thresholds['tight_low'], th_h=thresholds['tight_high'],
+                                           include_th_l=False, include_th_h=False)
 
 
 def time_in_hypoglycemia(data, glycemic_target='diabetes'):
@@ -153,16 +222,35 @@ def time_in_hypoglycemia(data, glycemic_target='diabetes'):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Set the threshold
-    if glycemic_target == 'diabetes':
-        th = 70.
-    elif glycemic_target == 'pregnancy':
-        th = 63.
-    else:
-        raise RuntimeError('`glycemic_target` can be `diabetes` or `pregnancy`.')
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return the result
+    return _time_in_hypoglycemia_from_array(values, _glycemic_thresholds(glycemic_target))
+
+
+def _time_in_hypoglycemia_from_array(values, thresholds=None):
+    """
+    Computes the time spent in hypoglycemia of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    thresholds: Mapping or None, optional, default: None
+        The glycemic thresholds to use, as returned by _glycemic_thresholds. If None, the thresholds of the `diabetes`
+        glycemic targets are used.
+
+    Returns
+    -------
+    time_in_hypoglycemia: float
+        The time percentage spent in hypoglycemia.
+    """
+    if thresholds is None:
+        thresholds = _glycemic_thresholds('diabetes')
 
     # Return the result
-    return time_in_given_below_range(data=data, th=th, include_th=True)
+    return _time_in_given_below_range_from_array(values=values, th=thresholds['hypo'], include_th=True)
 
 
 def time_in_l1_hypoglycemia(data, glycemic_target='diabetes'):
@@ -206,18 +294,36 @@ def time_in_l1_hypoglycemia(data, glycemic_target='diabetes'):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Set the threshold
-    if glycemic_target == 'diabetes':
-        th_l = 54.
-        th_h = 70.
-    elif glycemic_target == 'pregnancy':
-        th_l = 54.
-        th_h = 63.
-    else:
-        raise RuntimeError('`glycemic_target` can be `diabetes` or `pregnancy`.')
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return the result
+    return _time_in_l1_hypoglycemia_from_array(values, _glycemic_thresholds(glycemic_target))
+
+
+def _time_in_l1_hypoglycemia_from_array(values, thresholds=None):
+    """
+    Computes the time spent in l1 hypoglycemia of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    thresholds: Mapping or None, optional, default: None
+        The glycemic thresholds to use, as returned by _glycemic_thresholds. If None, the thresholds of the `diabetes`
+        glycemic targets are used.
+
+    Returns
+    -------
+    time_in_l1_hypoglycemia: float
+        The time percentage spent in l1 hypoglycemia.
+    """
+    if thresholds is None:
+        thresholds = _glycemic_thresholds('diabetes')
 
     # Return the result
-    return time_in_given_range(data=data, th_l=th_l, th_h=th_h, include_th_l=False, include_th_h=True)
+    return _time_in_given_range_from_array(values=values, th_l=thresholds['l2_hypo'], th_h=thresholds['hypo'],
+                                           include_th_l=False, include_th_h=True)
 
 
 def time_in_l2_hypoglycemia(data, glycemic_target='diabetes'):
@@ -261,16 +367,35 @@ def time_in_l2_hypoglycemia(data, glycemic_target='diabetes'):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Set the threshold
-    if glycemic_target == 'diabetes':
-        th = 54.
-    elif glycemic_target == 'pregnancy':
-        th = 54.
-    else:
-        raise RuntimeError('`glycemic_target` can be `diabetes` or `pregnancy`.')
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return the result
+    return _time_in_l2_hypoglycemia_from_array(values, _glycemic_thresholds(glycemic_target))
+
+
+def _time_in_l2_hypoglycemia_from_array(values, thresholds=None):
+    """
+    Computes the time spent in l2 hypoglycemia of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    thresholds: Mapping or None, optional, default: None
+        The glycemic thresholds to use, as returned by _glycemic_thresholds. If None, the thresholds of the `diabetes`
+        glycemic targets are used.
+
+    Returns
+    -------
+    time_in_l2_hypoglycemia: float
+        The time percentage spent in l2 hypoglycemia.
+    """
+    if thresholds is None:
+        thresholds = _glycemic_thresholds('diabetes')
 
     # Return the result
-    return time_in_given_below_range(data=data, th=th, include_th=True)
+    return _time_in_given_below_range_from_array(values=values, th=thresholds['l2_hypo'], include_th=True)
 
 
 def time_in_hyperglycemia(data, glycemic_target='diabetes'):
@@ -314,16 +439,35 @@ def time_in_hyperglycemia(data, glycemic_target='diabetes'):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Set the threshold
-    if glycemic_target == 'diabetes':
-        th = 180.
-    elif glycemic_target == 'pregnancy':
-        th = 140.
-    else:
-        raise RuntimeError('`glycemic_target` can be `diabetes` or `pregnancy`.')
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return the result
+    return _time_in_hyperglycemia_from_array(values, _glycemic_thresholds(glycemic_target))
+
+
+def _time_in_hyperglycemia_from_array(values, thresholds=None):
+    """
+    Computes the time spent in hyperglycemia of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    thresholds: Mapping or None, optional, default: None
+        The glycemic thresholds to use, as returned by _glycemic_thresholds. If None, the thresholds of the `diabetes`
+        glycemic targets are used.
+
+    Returns
+    -------
+    time_in_hyperglycemia: float
+        The time percentage spent in hyperglycemia.
+    """
+    if thresholds is None:
+        thresholds = _glycemic_thresholds('diabetes')
 
     # Return the result
-    return time_in_given_above_range(data=data, th=th, include_th=True)
+    return _time_in_given_above_range_from_array(values=values, th=thresholds['hyper'], include_th=True)
 
 
 def time_in_l1_hyperglycemia(data, glycemic_target='diabetes'):
@@ -367,18 +511,36 @@ def time_in_l1_hyperglycemia(data, glycemic_target='diabetes'):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Set the threshold
-    if glycemic_target == 'diabetes':
-        th_l = 180.
-        th_h = 250.
-    elif glycemic_target == 'pregnancy':
-        th_l = 140.
-        th_h = 250.
-    else:
-        raise RuntimeError('`glycemic_target` can be `diabetes` or `pregnancy`.')
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return the result
+    return _time_in_l1_hyperglycemia_from_array(values, _glycemic_thresholds(glycemic_target))
+
+
+def _time_in_l1_hyperglycemia_from_array(values, thresholds=None):
+    """
+    Computes the time spent in l1 hyperglycemia of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    thresholds: Mapping or None, optional, default: None
+        The glycemic thresholds to use, as returned by _glycemic_thresholds. If None, the thresholds of the `diabetes`
+        glycemic targets are used.
+
+    Returns
+    -------
+    time_in_l1_hyperglycemia: float
+        The time percentage spent in l1 hyperglycemia.
+    """
+    if thresholds is None:
+        thresholds = _glycemic_thresholds('diabetes')
 
     # Return the result
-    return time_in_given_range(data=data, th_l=th_l, th_h=th_h, include_th_l=True, include_th_h=False)
+    return _time_in_given_range_from_array(values=values, th_l=thresholds['hyper'], th_h=thresholds['l2_hyper'],
+                                           include_th_l=True, include_th_h=False)
 
 
 def time_in_l2_hyperglycemia(data, glycemic_target='diabetes'):
@@ -422,16 +584,35 @@ def time_in_l2_hyperglycemia(data, glycemic_target='diabetes'):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Set the threshold
-    if glycemic_target == 'diabetes':
-        th = 250.
-    elif glycemic_target == 'pregnancy':
-        th = 250.
-    else:
-        raise RuntimeError('`glycemic_target` can be `diabetes` or `pregnancy`.')
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return the result
+    return _time_in_l2_hyperglycemia_from_array(values, _glycemic_thresholds(glycemic_target))
+
+
+def _time_in_l2_hyperglycemia_from_array(values, thresholds=None):
+    """
+    Computes the time spent in l2 hyperglycemia of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    thresholds: Mapping or None, optional, default: None
+        The glycemic thresholds to use, as returned by _glycemic_thresholds. If None, the thresholds of the `diabetes`
+        glycemic targets are used.
+
+    Returns
+    -------
+    time_in_l2_hyperglycemia: float
+        The time percentage spent in l2 hyperglycemia.
+    """
+    if thresholds is None:
+        thresholds = _glycemic_thresholds('diabetes')
 
     # Return the result
-    return time_in_given_above_range(data=data, th=th, include_th=True)
+    return _time_in_given_above_range_from_array(values=values, th=thresholds['l2_hyper'], include_th=True)
 
 
 def time_in_given_range(data, th_l, th_h, include_th_l=False, include_th_h=False):
@@ -485,6 +666,32 @@ def time_in_given_range(data, th_l, th_h, include_th_l=False, include_th_h=False
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
+    # Return the results
+    return _time_in_given_range_from_array(values, th_l, th_h, include_th_l, include_th_h)
+
+
+def _time_in_given_range_from_array(values, th_l, th_h, include_th_l=False, include_th_h=False):
+    """
+    Computes the time spent between a given range of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    th_l: float
+        The low level threshold of the range of interest (in mg/dl).
+    th_h: float
+        The high level threshold of the range of interest (in mg/dl).
+    include_th_l: bool, optional, default: False
+        A flag indicating whether to include or not th_l in the range of interest.
+    include_th_h: bool, optional, default: False
+        A flag indicating whether to include or not th_h in the range of interest.
+
+    Returns
+    -------
+    time_in_given_range: float
+        The time percentage spent in the given range.
+    """
     # Return nan if all values are nan
     if values.size == 0:
         return np.nan
@@ -543,6 +750,28 @@ def time_in_given_above_range(data, th, include_th=False):
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
+    # Return the results
+    return _time_in_given_above_range_from_array(values, th, include_th)
+
+
+def _time_in_given_above_range_from_array(values, th, include_th=False):
+    """
+    Computes the time spent above a given range of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    th: float
+        The threshold of the range of interest (in mg/dl).
+    include_th: bool, optional, default: False
+        A flag indicating whether to include or not th in the range of interest.
+
+    Returns
+    -------
+    time_in_given_above_range: float
+        The time percentage spent above the given range.
+    """
     # Return nan if all values are nan
     if values.size == 0:
         return np.nan
@@ -600,6 +829,28 @@ def time_in_given_below_range(data, th, include_th=False):
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
+    # Return the results
+    return _time_in_given_below_range_from_array(values, th, include_th)
+
+
+def _time_in_given_below_range_from_array(values, th, include_th=False):
+    """
+    Computes the time spent below a given range of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    th: float
+        The threshold of the range of interest (in mg/dl).
+    include_th: bool, optional, default: False
+        A flag indicating whether to include or not th in the range of interest.
+
+    Returns
+    -------
+    time_in_given_below_range: float
+        The time percentage spent below the given range.
+    """
     # Return nan if all values are nan
     if values.size == 0:
         return np.nan
@@ -609,3 +860,56 @@ def time_in_given_below_range(data, th, include_th=False):
 
     # Return the results
     return 100 * np.where(flags)[0].shape[0]/values.shape[0]
+
+
+def _tir_kernel(values, thresholds=None):
+    """
+    Computes all the time in ranges metrics of an array of non-nan glucose values at once, assigning each value to a
+    glycemic band with a single pass and counting the values falling in each band.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    thresholds: Mapping or None, optional, default: None
+        The glycemic thresholds to use, as returned by _glycemic_thresholds. If None, the thresholds of the `diabetes`
+        glycemic targets are used.
+
+    Returns
+    -------
+    time_in_ranges: dict
+        A dictionary with fields `time_in_target`, `time_in_tight_target`, `time_in_hypoglycemia`,
+        `time_in_l1_hypoglycemia`, `time_in_l2_hypoglycemia`, `time_in_hyperglycemia`, `time_in_l1_hyperglycemia` and
+        `time_in_l2_hyperglycemia`.
+    """
+    if thresholds is None:
+        thresholds = _glycemic_thresholds('diabetes')
+
+    # Set the thresholds. Values equal to a low threshold belong to the band below it (i.e., hypoglycemia), values
+    # equal to a high threshold belong to the band above it (i.e., hyperglycemia).
+    th_low = np.array([thresholds['l2_hypo'], thresholds['hypo'], thresholds['tight_low']])
+    th_high = np.array([thresholds['tight_high'], thresholds['hyper'], thresholds['l2_hyper']])
+
+    # Return nan if all values are nan
+    if values.size == 0:
+        return dict.fromkeys(['time_in_target', 'time_in_tight_target', 'time_in_hypoglycemia',
+                              'time_in_l1_hypoglycemia', 'time_in_l2_hypoglycemia', 'time_in_hyperglycemia',
+                              'time_in_l1_hyperglycemia', 'time_in_l2_hyperglycemia'], np.nan)
+
+    # Count the values in each band:
+    # 0: <= 54, 1: l1 hypoglycemia, 2: between the hypoglycemia and the tight target low thresholds, 3: tight target,
+    # 4: between the tight target and the target high thresholds, 5: l1 hyperglycemia, 6: >= 250
+    bands = np.searchsorted(th_low, values, side='left') + np.searchsorted(th_high, values, side='right')
+    counts = np.bincount(bands, minlength=7)
+
+    # Return the results
+    time_in_ranges = dict()
+    time_in_ranges['time_in_target'] = 100 * (counts[2] + counts[3] + counts[4]) / values.shape[0]
+    time_in_ranges['time_in_tight_target'] = 100 * counts[3] / values.shape[0]
+    time_in_ranges['time_in_hypoglycemia'] = 100 * (counts[0] + counts[1]) / values.shape[0]
+    time_in_ranges['time_in_l1_hypoglycemia'] = 100 * counts[1] / values.shape[0]
+    time_in_ranges['time_in_l2_hypoglycemia'] = 100 * counts[0] / values.shape[0]
+    time_in_ranges['time_in_hyperglycemia'] = 100 * (counts[5] + counts[6]) / values.shape[0]
+    time_in_ranges['time_in_l1_hyperglycemia'] = 100 * counts[5] / values.shape[0]
+    time_in_ranges['time_in_l2_hyperglycemia'] = 100 * counts[6] / values.shape[0]
+    return time_in_ranges
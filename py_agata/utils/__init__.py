@@ -2,6 +2,7 @@ import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from copy import copy
+from collections import namedtuple
 
 from py_agata.input_validator import *
 
@@ -360,4 +361,86 @@ def read_freestyle_libre_data(file, extension='xlsx'):
 
     data = pd.DataFrame(data={'t': t, 'glucose': glucose})
     data = data.sort_values(by='t')
-    return data
\ No newline at end of file
+    return data
+
+def _day_limits(t):
+    """
+    Locates the days spanned by the given timestamps. Day `d` goes from the midnight of the first timestamp plus `d`
+    days (included) to the following midnight (excluded).
+
+    Parameters
+    ----------
+    t: np.ndarray
+        A sorted vector of np.datetime64 timestamps
+
+    Returns
+    -------
+    limits: np.ndarray
+        A vector of `n_days + 1` indices such that the samples of day `d` are `t[limits[d]:limits[d+1]]`
+    """
+    first_day = t[0].astype('datetime64[D]')
+    last_day = t[-1].astype('datetime64[D]')
+    midnights = np.arange(first_day, last_day + np.timedelta64(2, 'D'), np.timedelta64(1, 'D')).astype(t.dtype)
+    return np.searchsorted(t, midnights, side='left')
+
+
+def _lagged_differences(glucose, t, lag, out=None):
+    """
+    Computes the differences between each glucose value and the glucose value at least `lag` in the past. On a
+    homogeneous timegrid, such value is always the same number of samples back, so the differences are computed
+    between two shifted views of `glucose` without any gather.
+
+    Parameters
+    ----------
+    glucose: np.ndarray
+        The glucose values (in mg/dl), possibly containing nan values
+    t: np.ndarray
+        The sorted, homogeneously sampled np.datetime64 timestamps of the glucose values
+    lag: np.timedelta64
+        The lag to look back
+    out: np.ndarray, optional, default: None
+        A float64 buffer of at least `glucose.size` elements where to store the differences. If None, a new array is
+        allocated.
+
+    Returns
+    -------
+    differences: np.ndarray
+        The differences, for each of the timestamps having one at least `lag` in the past (might be empty)
+    """
+    # Number of samples between each timestamp and the last one at least lag in the past
+    k = np.searchsorted(t, t[0] + lag, side='left') if t.size > 0 else 0
+    n_differences = max(glucose.size - k, 0)
+    if out is None:
+        out = np.empty(shape=(n_differences,))
+    return np.subtract(glucose[k:], glucose[:n_differences], out=out[:n_differences])
+
+
+# The glucose profile laid out as plain arrays, shared among the metrics of analyze_glucose_profile:
+# - t: the np.datetime64 timestamps
+# - glucose: the glucose values (np.float64, possibly nan)
+# - nan_mask: the flags of the nan glucose values
+# - values: the non-nan glucose values
+# - day_limits: the day limits of the timestamps (see _day_limits)
+_GlucoseSoA = namedtuple('_GlucoseSoA', ['t', 'glucose', 'nan_mask', 'values', 'day_limits'])
+
+
+def _glucose_soa(data):
+    """
+    Extracts the arrays of a glucose profile once, so that they can be shared among the metrics.
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        Pandas dataframe with a column `glucose` containing the glucose data
+        to analyze (in mg/dl) and a column `t` containing their timestamps.
+
+    Returns
+    -------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile.
+    """
+    t = data.t.values
+    glucose = data.glucose.to_numpy(dtype=np.float64)
+    nan_mask = np.isnan(glucose)
+    day_limits = _day_limits(t) if t.size > 0 else np.zeros(shape=(1,), dtype=int)
+    return _GlucoseSoA(t=t, glucose=glucose, nan_mask=nan_mask, values=glucose[~nan_mask], day_limits=day_limits)
@@ -1,11 +1,20 @@
 import numpy as np
 import pandas as pd
-from scipy.stats import iqr
 from scipy.signal import find_peaks
 from datetime import timedelta
 
 from py_agata.input_validator import *
-from py_agata.time_in_ranges import time_in_target, time_in_hypoglycemia
+from py_agata.utils import _lagged_differences, _glucose_soa
+from py_agata.time_in_ranges import _time_in_target_from_array, _time_in_hypoglycemia_from_array
+
+# Use bottleneck, if available, for the nan-aware reductions: it walks the data once without allocating nan masks
+try:
+    from bottleneck import nanmean as _nanmean, nanstd as _nanstd
+except ImportError:
+    from numpy import nanmean as _nanmean, nanstd as _nanstd
+
+# Coefficients of the cubic polynomial mapping the maximum glucose to the y coordinate of the CVGA
+_CVGA_Y_POLY = np.polyfit([110, 180, 300, 400], [0, 20, 40, 60], 3)
 
 
 def mean_glucose(data):
@@ -47,12 +56,26 @@ def mean_glucose(data):
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
-    # Return nan if all values are nan
-    if values.size == 0:
-        return np.nan
+    # Return the result
+    return _mean_glucose_from_array(values)
+
+
+def _mean_glucose_from_array(values):
+    """
+    Computes the mean glucose level of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
 
+    Returns
+    -------
+    mean_glucose: float
+        The mean glucose level.
+    """
     # Return the result
-    return np.mean(values)
+    return _mean_std(values)['mean']
 
 
 def median_glucose(data):
@@ -94,6 +117,24 @@ def median_glucose(data):
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
+    # Return the result
+    return _median_glucose_from_array(values)
+
+
+def _median_glucose_from_array(values):
+    """
+    Computes the median glucose level of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    median_glucose: float
+        The median glucose level.
+    """
     # Return nan if all values are nan
     if values.size == 0:
         return np.nan
@@ -141,12 +182,26 @@ def std_glucose(data):
     # Get non-nan values
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
-    # Return nan if all values are nan
-    if values.size == 0:
-        return np.nan
+    # Return the result
+    return _std_glucose_from_array(values)
 
+
+def _std_glucose_from_array(values):
+    """
+    Computes the std glucose level of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    std_glucose: float
+        The std glucose level.
+    """
     # Return the result
-    return np.std(values, ddof=1)
+    return _mean_std(values)['std']
 
 
 def cv_glucose(data):
@@ -185,8 +240,29 @@ def cv_glucose(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return the result
+    return _cv_glucose_from_array(values)
+
+
+def _cv_glucose_from_array(values):
+    """
+    Computes the coefficient of variation of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    cv_glucose: float
+        The cv of glucose.
+    """
     # Return the result
-    return 100 * std_glucose(data) / mean_glucose(data)
+    return _derived_stats(_mean_std(values))['cv_glucose']
 
 
 def range_glucose(data):
@@ -225,10 +301,33 @@ def range_glucose(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
     # Return the result
-    if(data.glucose.values.size == 0):
+    return _range_glucose_from_array(values)
+
+
+def _range_glucose_from_array(values):
+    """
+    Computes the spanned range of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    range: float
+        The range of glucose.
+    """
+    # Return nan if all values are nan
+    if values.size == 0:
         return np.nan
-    return np.nanmax(data.glucose.values) - np.nanmin(data.glucose.values)
+
+    # Return the result
+    return np.max(values) - np.min(values)
 
 
 def iqr_glucose(data):
@@ -271,7 +370,138 @@ def iqr_glucose(data):
     values = data.glucose.values[~np.isnan(data.glucose.values)]
 
     # Return the result
-    return iqr(values)
+    return _iqr_glucose_from_array(values)
+
+
+def _iqr_glucose_from_array(values):
+    """
+    Computes the interquartile range of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    iqr_glucose: float
+        The interquartile range of glucose.
+    """
+    # Return nan if all values are nan
+    if values.size == 0:
+        return np.nan
+
+    # Return the result
+    q1, q3 = _quantiles(values, [0.25, 0.75])
+    return q3 - q1
+
+
+def _quantiles(values, qs):
+    """
+    Computes the given quantiles of a non-empty array of non-nan glucose values using linear interpolation (as
+    np.percentile does). The order statistics are located via np.partition, which runs in linear time instead of
+    sorting the whole array.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+    qs: list
+        The quantiles to compute (between 0 and 1).
+
+    Returns
+    -------
+    quantiles: np.ndarray
+        The computed quantiles.
+    """
+    # Get the (fractional) position of each quantile in the sorted array
+    pos = np.asarray(qs, dtype=float) * (values.size - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, values.size - 1)
+
+    # Place the required order statistics and interpolate between them
+    part = np.partition(values, np.union1d(lo, hi))
+    return part[lo] + (pos - lo) * (part[hi] - part[lo])
+
+
+def _basic_stats(values):
+    """
+    Computes the basic descriptive statistics of an array of non-nan glucose values in a single sweep, i.e.,
+    one partition for median, quartiles and extremes and one pass for mean and std.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    stats: dict
+        A dictionary with fields `mean`, `std`, `median`, `q1`, `q3`, `min`, `max` (in mg/dl) and `n` (number of
+        values). All the fields but `n` are nan if `values` is empty, `std` is nan if `values` has less than 2 samples.
+    """
+    n = values.size
+
+    # Return nan if all values are nan
+    if n == 0:
+        return {'mean': np.nan, 'std': np.nan, 'median': np.nan, 'q1': np.nan, 'q3': np.nan,
+                'min': np.nan, 'max': np.nan, 'n': 0}
+
+    # Get extremes, quartiles and median at once
+    v_min, q1, median, q3, v_max = _quantiles(values, [0, 0.25, 0.5, 0.75, 1])
+
+    stats = _mean_std(values)
+    stats.update({'median': median, 'q1': q1, 'q3': q3, 'min': v_min, 'max': v_max})
+    return stats
+
+
+def _mean_std(values):
+    """
+    Computes the mean and the (unbiased) std of an array of non-nan glucose values in one pass. It is the only
+    source of mean and std for both analyze_glucose_profile and the single-metric functions, so that they agree
+    to the last bit.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    stats: dict
+        A dictionary with fields `mean`, `std` (in mg/dl) and `n` (number of values). `mean` is nan if `values` is
+        empty, `std` is nan if `values` has less than 2 samples.
+    """
+    n = values.size
+
+    # Return nan if all values are nan
+    if n == 0:
+        return {'mean': np.nan, 'std': np.nan, 'n': 0}
+
+    mean = np.mean(values)
+    deviations = values - mean
+    std = np.sqrt(np.dot(deviations, deviations) / (n - 1)) if n > 1 else np.nan
+
+    return {'mean': mean, 'std': std, 'n': n}
+
+
+def _derived_stats(stats):
+    """
+    Computes the variability indices that derive from mean and std only, i.e., cv, GMI and J-Index.
+
+    Parameters
+    ----------
+    stats: dict
+        A dictionary with fields `mean` and `std` (in mg/dl), as returned by _mean_std or _basic_stats.
+
+    Returns
+    -------
+    derived_stats: dict
+        A dictionary with fields `cv_glucose`, `gmi` and `j_index`.
+    """
+    return {'cv_glucose': 100 * stats['std'] / stats['mean'],
+            'gmi': 3.31 + 0.02392 * stats['mean'],
+            'j_index': 1e-3 * (stats['mean'] + stats['std']) ** 2}
 
 
 def auc_glucose_over_basal(data, basal):
@@ -311,19 +541,36 @@ def auc_glucose_over_basal(data, basal):
     check_homogeneous_timegrid(data)
     check_float_parameter(basal)
 
-    # Get non-nan values
-    values = data.glucose.values[~np.isnan(data.glucose.values)]
+    # Return the result
+    return _auc_glucose_over_basal_from_soa(_glucose_soa(data), basal)
+
+
+def _auc_glucose_over_basal_from_soa(soa, basal):
+    """
+    Computes the area under the glucose curve over a basal value of a glucose profile.
 
+    Parameters
+    ----------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile (see _glucose_soa).
+    basal: float
+        The basal value to subtract to the glucose trace (in mg/dl).
+
+    Returns
+    -------
+    auc_glucose_over_basal: float
+        The area under the glucose curve.
+    """
     # Return nan if all values are nan
-    if values.size == 0:
+    if soa.values.size == 0:
         return np.nan
 
     # Shift the trace
-    values = values - basal
+    values = soa.values - basal
 
     # Get ts
-    t0 = pd.to_datetime(data.t.values[0]).to_pydatetime()
-    t1 = pd.to_datetime(data.t.values[1]).to_pydatetime()
+    t0 = pd.to_datetime(soa.t[0]).to_pydatetime()
+    t1 = pd.to_datetime(soa.t[1]).to_pydatetime()
     ts = (t1 - t0).total_seconds() / 60
 
     # Return the result
@@ -409,8 +656,29 @@ def gmi(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
     # Return results
-    return 3.31 + 0.02392 * mean_glucose(data)
+    return _gmi_from_array(values)
+
+
+def _gmi_from_array(values):
+    """
+    Computes the glucose management indicator of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    gmi: float
+        The glucose management indicator.
+    """
+    # Return results
+    return _derived_stats(_mean_std(values))['gmi']
 
 
 def cogi(data):
@@ -451,15 +719,36 @@ def cogi(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    # Return results
+    return _cogi_from_array(values)
+
+
+def _cogi_from_array(values):
+    """
+    Computes the Continuous Glucose Monitoring Index (COGI) of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    cogi: float
+        The Continuous Glucose Monitoring Index (COGI).
+    """
     # Compute TIR component
-    tir = time_in_target(data)*0.5
+    tir = _time_in_target_from_array(values)*0.5
 
     # Compute TBR component
-    tbr = np.min([15, time_in_hypoglycemia(data)])
+    tbr = np.min([15, _time_in_hypoglycemia_from_array(values)])
     tbr = (100 - 100 / 15 * tbr) * 0.35
 
     # Compute GV component
-    gv = np.min([np.max([std_glucose(data) / 18.018, 1]), 6])
+    gv = np.min([np.max([_std_glucose_from_array(values) / 18.018, 1]), 6])
     gv = (120 - 20 * gv) * 0.15
 
     # Return results
@@ -504,28 +793,44 @@ def conga(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
+    # Return the result
+    return _conga_from_soa(_glucose_soa(data))
+
+
+def _conga_from_soa(soa, out=None):
+    """
+    Computes the Continuous Overall Net Glycemic Action (CONGA) of a glucose profile.
+
+    Parameters
+    ----------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile (see _glucose_soa).
+    out: np.ndarray, optional, default: None
+        A float64 scratch buffer of at least `soa.glucose.size` elements. If None, a new array is allocated.
+
+    Returns
+    -------
+    conga: float
+        The Continuous Overall Net Glycemic Action (CONGA) of the given data.
+    """
     # Set the CONGAOrd hyperparameter to 4 (number of hours in the past it
     # refers to)
     conga_ord = 4
 
     # Build vectors
-    n = data.glucose.values.size
+    n = soa.glucose.size
     dc = np.empty(shape=(0,))
 
-    for i in range(1,n):
+    if n > 1:
 
-        # Find the index referring to conga_ord hours ago
-        j = np.where(data.t <= (pd.to_datetime(data.t.values[i]).to_pydatetime() - timedelta(hours=conga_ord)))[0]
-
-        if not j.size == 0:
-            j = j[-1]
-            dc = np.append(dc, data.glucose.values[i] - data.glucose[j])
+        # Get the differences with respect to conga_ord hours ago
+        dc = _lagged_differences(soa.glucose, soa.t, np.timedelta64(conga_ord, 'h'), out=out)
 
     # Return results
     if dc.size == 0:
         return np.nan
     else:
-        return np.nanstd(dc, ddof=1)
+        return _nanstd(dc, ddof=1)
 
 
 def j_index(data):
@@ -566,7 +871,27 @@ def j_index(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    return 1e-3 * (mean_glucose(data) + std_glucose(data)) ** 2
+    # Get non-nan values
+    values = data.glucose.values[~np.isnan(data.glucose.values)]
+
+    return _j_index_from_array(values)
+
+
+def _j_index_from_array(values):
+    """
+    Computes the J-Index of an array of non-nan glucose values.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        The non-nan glucose values to analyze (in mg/dl).
+
+    Returns
+    -------
+    j_index: float
+        The J-Index.
+    """
+    return _derived_stats(_mean_std(values))['j_index']
 
 
 def mage_plus_index(data):
@@ -607,138 +932,7 @@ def mage_plus_index(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Get the first and last day limits
-    if data.t.values.size == 0:
-        return np.nan
-
-    first_day = pd.to_datetime(data.t.values[0]).to_pydatetime()
-    first_day = first_day.replace(hour=0, minute=0, second=0)
-    last_day = pd.to_datetime(data.t.values[-1]).to_pydatetime()
-    last_day = last_day.replace(day=last_day.day + 1, hour=0, minute=0, second=0)
-
-    # Calculate the number of days and preallocate
-    n_days = (last_day - first_day).days
-    mage_day_plus = np.empty(shape=(n_days,))
-
-    for d in range(0, n_days):
-
-        # Step 0: parameters
-
-        # Get the day of data
-        low_limit = data.t >= (first_day + timedelta(days=d))
-        high_limit = data.t < (first_day + timedelta(days=d + 1))
-        flags = np.logical_and(low_limit, high_limit)
-        day_data = data.glucose.values[flags]
-
-        # Get glucose values (might be nan)
-        std_within = np.nanstd(day_data, ddof=1)
-        n = day_data.size
-
-        if n > 3:
-            # Step 1: turning points are only local extrema
-            i_max = find_peaks(day_data)[0]
-            i_min = find_peaks(-day_data)[0]
-            i_turning = np.union1d([0, n-1], np.union1d(i_max, i_min)).astype(int)
-
-            turning = day_data[i_turning]
-            n_turning = i_turning.size
-
-            # Step 2: Turning points of no interest are removed
-            # A turning point is removed if it's not significantly different from
-            # BOTH its left and right-hand side RETAINED neighbours.
-
-            to_be_kept = [True] * n_turning
-
-            for i in range(1, n_turning-1): # First and last samples are retained
-
-                condition_1 = abs(turning[i] - turning[i - 1]) < std_within
-                condition_2 = abs(turning[i + 1] - turning[i]) < std_within
-                to_be_kept[i] = not(condition_1 and condition_2)
-
-            i_turning = i_turning[to_be_kept]
-
-            # Step 3: Turning points are removed again or moved appropriately
-            i = 1
-            while i < len(i_turning)-1:
-                prev = i_turning[i - 1]
-                curr = i_turning[i]
-                next = i_turning[i + 1]
-                prev_slope = day_data[curr] - day_data[prev]
-                next_slope = day_data[next] - day_data[curr]
-
-                if prev_slope < 0 and next_slope > 0:  # Minimum
-                    # The actual current turning point is the min in the interval
-                    temp = np.nanargmin(day_data[prev:(next+1)]) + prev
-                    curr = temp
-                    i_turning[i] = curr
-                    # The actual previous turning point is the max to the left of the current turning point.
-                    temp = np.nanargmax(day_data[prev:curr]) + prev
-                    i_turning[i - 1] = temp
-                    # The actual following turning point is the max to the right of the current turning point.
-                    temp = np.nanargmax(day_data[(curr + 1):(next+1)]) + curr + 1
-                    i_turning[i + 1] = temp
-
-                    i += 1
-                elif prev_slope > 0 and next_slope < 0:  # Maximum
-                    # The actual current turning point is the max in the interval
-                    temp = np.nanargmax(day_data[prev:(next+1)]) + prev
-                    curr = temp
-                    i_turning[i] = curr
-                    # The actual previous turning point is the min to the left of the current turning point.
-                    temp = np.nanargmin(day_data[prev:curr]) + prev
-                    i_turning[i - 1] = temp
-                    # The actual following turning point is the min to the right of the current turning point.
-                    temp = np.nanargmin(day_data[(curr + 1):(next+1)]) + curr + 1
-                    i_turning[i + 1] = temp
-
-                    i += 1
-                else:  # Middle point
-                    i_turning = np.delete(i_turning, i)
-
-            # Step 4: Remove residual spurious turning points.
-            # Turning points not significantly different from EITHER neighbour are
-            # removed. Some extra processing is needed for the first and last sample.
-            sample1 = day_data[i_turning[0]]
-            sample2 = day_data[i_turning[1]]
-
-            if abs(sample2 - sample1) < std_within:
-                i_turning = np.delete(i_turning, 0)
-
-            if len(i_turning) > 1:
-                # Last sample processing
-                sample1 = day_data[i_turning[-2]]
-                sample2 = day_data[i_turning[-1]]
-                if abs(sample2 - sample1) < std_within:
-                    i_turning = np.delete(i_turning, len(i_turning)-1)
-
-            turning = day_data[i_turning]
-            n_turning = len(i_turning)
-
-            # Internal points
-            to_be_kept = np.ones(n_turning, dtype=bool)
-            for i in range(1, n_turning - 1):
-                condition1 = abs(turning[i] - turning[i - 1]) < std_within
-                condition2 = abs(turning[i + 1] - turning[i]) < std_within
-                to_be_kept[i] = not(condition1 or condition2)
-
-            i_turning = i_turning[to_be_kept]
-            turning = day_data[i_turning]
-
-            # Step 5: Compute daily MAGE+
-            excursions = np.diff(turning)
-            mage_day_plus[d] = np.nanmean(excursions[excursions > 0])
-        else:
-            mage_day_plus[d] = np.nan
-
-    # Compute index
-    mage_day_plus[np.isnan(mage_day_plus)] = 0  # Correct for 'mean' behavior
-    mpi = np.mean(mage_day_plus)
-
-    # Manage all nan data
-    if np.all(np.isnan(data['glucose'])):
-        mpi = np.nan
-
-    return mpi
+    return _mage_kernel(_glucose_soa(data))['mage_plus_index']
 
 
 def mage_minus_index(data):
@@ -779,137 +973,7 @@ def mage_minus_index(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    if data.t.values.size == 0:
-        return np.nan
-    # Get the first and last day limits
-    first_day = pd.to_datetime(data.t.values[0]).to_pydatetime()
-    first_day = first_day.replace(hour=0, minute=0, second=0)
-    last_day = pd.to_datetime(data.t.values[-1]).to_pydatetime()
-    last_day = last_day.replace(day=last_day.day + 1, hour=0, minute=0, second=0)
-
-    # Calculate the number of days and preallocate
-    n_days = (last_day - first_day).days
-    mage_day_minus = np.empty(shape=(n_days,))
-
-    for d in range(0, n_days):
-
-        # Step 0: parameters
-
-        # Get the day of data
-        low_limit = data.t >= (first_day + timedelta(days=d))
-        high_limit = data.t < (first_day + timedelta(days=d + 1))
-        flags = np.logical_and(low_limit, high_limit)
-        day_data = data.glucose.values[flags]
-
-        # Get glucose values (might be nan)
-        std_within = np.nanstd(day_data, ddof=1)
-        n = day_data.size
-
-        if n > 3:
-            # Step 1: turning points are only local extrema
-            i_max = find_peaks(day_data)[0]
-            i_min = find_peaks(-day_data)[0]
-            i_turning = np.union1d([0, n-1], np.union1d(i_max, i_min)).astype(int)
-
-            turning = day_data[i_turning]
-            n_turning = i_turning.size
-
-            # Step 2: Turning points of no interest are removed
-            # A turning point is removed if it's not significantly different from
-            # BOTH its left and right-hand side RETAINED neighbours.
-
-            to_be_kept = [True] * n_turning
-
-            for i in range(1, n_turning-1): # First and last samples are retained
-
-                condition_1 = abs(turning[i] - turning[i - 1]) < std_within
-                condition_2 = abs(turning[i + 1] - turning[i]) < std_within
-                to_be_kept[i] = not(condition_1 and condition_2)
-
-            i_turning = i_turning[to_be_kept]
-
-            # Step 3: Turning points are removed again or moved appropriately
-            i = 1
-            while i < len(i_turning)-1:
-                prev = i_turning[i - 1]
-                curr = i_turning[i]
-                next = i_turning[i + 1]
-                prev_slope = day_data[curr] - day_data[prev]
-                next_slope = day_data[next] - day_data[curr]
-
-                if prev_slope < 0 and next_slope > 0:  # Minimum
-                    # The actual current turning point is the min in the interval
-                    temp = np.nanargmin(day_data[prev:(next+1)]) + prev
-                    curr = temp
-                    i_turning[i] = curr
-                    # The actual previous turning point is the max to the left of the current turning point.
-                    temp = np.nanargmax(day_data[prev:curr]) + prev
-                    i_turning[i - 1] = temp
-                    # The actual following turning point is the max to the right of the current turning point.
-                    temp = np.nanargmax(day_data[(curr + 1):(next+1)]) + curr + 1
-                    i_turning[i + 1] = temp
-
-                    i += 1
-                elif prev_slope > 0 and next_slope < 0:  # Maximum
-                    # The actual current turning point is the max in the interval
-                    temp = np.nanargmax(day_data[prev:(next+1)]) + prev
-                    curr = temp
-                    i_turning[i] = curr
-                    # The actual previous turning point is the min to the left of the current turning point.
-                    temp = np.nanargmin(day_data[prev:curr]) + prev
-                    i_turning[i - 1] = temp
-                    # The actual following turning point is the min to the right of the current turning point.
-                    temp = np.nanargmin(day_data[(curr + 1):(next+1)]) + curr + 1
-                    i_turning[i + 1] = temp
-
-                    i += 1
-                else:  # Middle point
-                    i_turning = np.delete(i_turning, i)
-
-            # Step 4: Remove residual spurious turning points.
-            # Turning points not significantly different from EITHER neighbour are
-            # removed. Some extra processing is needed for the first and last sample.
-            sample1 = day_data[i_turning[0]]
-            sample2 = day_data[i_turning[1]]
-
-            if abs(sample2 - sample1) < std_within:
-                i_turning = np.delete(i_turning, 0)
-
-            if len(i_turning) > 1:
-                # Last sample processing
-                sample1 = day_data[i_turning[-2]]
-                sample2 = day_data[i_turning[-1]]
-                if abs(sample2 - sample1) < std_within:
-                    i_turning = np.delete(i_turning, len(i_turning)-1)
-
-            turning = day_data[i_turning]
-            n_turning = len(i_turning)
-
-            # Internal points
-            to_be_kept = np.ones(n_turning, dtype=bool)
-            for i in range(1, n_turning - 1):
-                condition1 = abs(turning[i] - turning[i - 1]) < std_within
-                condition2 = abs(turning[i + 1] - turning[i]) < std_within
-                to_be_kept[i] = not(condition1 or condition2)
-
-            i_turning = i_turning[to_be_kept]
-            turning = day_data[i_turning]
-
-            # Step 5: Compute daily MAGE+
-            excursions = np.diff(turning)
-            mage_day_minus[d] = np.nanmean(excursions[excursions < 0])
-        else:
-            mage_day_minus[d] = np.nan
-
-    # Compute index
-    mage_day_minus[np.isnan(mage_day_minus)] = 0  # Correct for 'mean' behavior
-    mmi = -np.mean(mage_day_minus)
-
-    # Manage all nan data
-    if np.all(np.isnan(data['glucose'])):
-        mmi = np.nan
-
-    return mmi
+    return _mage_kernel(_glucose_soa(data))['mage_minus_index']
 
 
 def mage_index(data):
@@ -950,9 +1014,7 @@ def mage_index(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    if np.isnan(mage_plus_index(data)) and np.isnan(mage_minus_index(data)):
-        return np.nan
-    return np.nanmean([mage_plus_index(data), mage_minus_index(data)])
+    return _mage_kernel(_glucose_soa(data))['mage_index']
 
 
 def ef_index(data):
@@ -993,140 +1055,171 @@ def ef_index(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    if data.t.values.size == 0:
-        return np.nan
+    return _mage_kernel(_glucose_soa(data))['ef_index']
+
+
+def _day_excursions(day_data):
+    """
+    Computes the glycemic excursions of one day of data, i.e., the differences between consecutive significant turning
+    points (peaks and nadirs differing by more than the within-day standard deviation).
+
+    Parameters
+    ----------
+    day_data: np.ndarray
+        The glucose values of the day (in mg/dl), possibly containing nan values. Must have more than 3 samples.
+
+    Returns
+    -------
+    excursions: np.ndarray
+        The glycemic excursions of the day (in mg/dl).
+    """
+    # Step 0: parameters
+    # Get glucose values (might be nan)
+    std_within = _nanstd(day_data, ddof=1)
+    n = day_data.size
+
+    # Step 1: turning points are only local extrema
+    i_max = find_peaks(day_data)[0]
+    i_min = find_peaks(-day_data)[0]
+    i_turning = np.union1d([0, n-1], np.union1d(i_max, i_min)).astype(int)
+
+    turning = day_data[i_turning]
+    n_turning = i_turning.size
+
+    # Step 2: Turning points of no interest are removed
+    # A turning point is removed if it's not significantly different from
+    # BOTH its left and right-hand side RETAINED neighbours.
+
+    to_be_kept = [True] * n_turning
+
+    for i in range(1, n_turning-1): # First and last samples are retained
+
+        condition_1 = abs(turning[i] - turning[i - 1]) < std_within
+        condition_2 = abs(turning[i + 1] - turning[i]) < std_within
+        to_be_kept[i] = not(condition_1 and condition_2)
+
+    i_turning = i_turning[to_be_kept]
+
+    # Step 3: Turning points are removed again or moved appropriately
+    i = 1
+    while i < len(i_turning)-1:
+        prev = i_turning[i - 1]
+        curr = i_turning[i]
+        next = i_turning[i + 1]
+        prev_slope = day_data[curr] - day_data[prev]
+        next_slope = day_data[next] - day_data[curr]
+
+        if prev_slope < 0 and next_slope > 0:  # Minimum
+            # The actual current turning point is the min in the interval
+            temp = np.nanargmin(day_data[prev:(next+1)]) + prev
+            curr = temp
+            i_turning[i] = curr
+            # The actual previous turning point is the max to the left of the current turning point.
+            temp = np.nanargmax(day_data[prev:curr]) + prev
+            i_turning[i - 1] = temp
+            # The actual following turning point is the max to the right of the current turning point.
+            temp = np.nanargmax(day_data[(curr + 1):(next+1)]) + curr + 1
+            i_turning[i + 1] = temp
+
+            i += 1
+        elif prev_slope > 0 and next_slope < 0:  # Maximum
+            # The actual current turning point is the max in the interval
+            temp = np.nanargmax(day_data[prev:(next+1)]) + prev
+            curr = temp
+            i_turning[i] = curr
+            # The actual previous turning point is the min to the left of the current turning point.
+            temp = np.nanargmin(day_data[prev:curr]) + prev
+            i_turning[i - 1] = temp
+            # The actual following turning point is the min to the right of the current turning point.
+            temp = np.nanargmin(day_data[(curr + 1):(next+1)]) + curr + 1
+            i_turning[i + 1] = temp
+
+            i += 1
+        else:  # Middle point
+            i_turning = np.delete(i_turning, i)
+
+    # Step 4: Remove residual spurious turning points.
+    # Turning points not significantly different from EITHER neighbour are
+    # removed. Some extra processing is needed for the first and last sample.
+    sample1 = day_data[i_turning[0]]
+    sample2 = day_data[i_turning[1]]
+
+    if abs(sample2 - sample1) < std_within:
+        i_turning = np.delete(i_turning, 0)
+
+    if len(i_turning) > 1:
+        # Last sample processing
+        sample1 = day_data[i_turning[-2]]
+        sample2 = day_data[i_turning[-1]]
+        if abs(sample2 - sample1) < std_within:
+            i_turning = np.delete(i_turning, len(i_turning)-1)
+
+    turning = day_data[i_turning]
+    n_turning = len(i_turning)
+
+    # Internal points
+    to_be_kept = np.ones(n_turning, dtype=bool)
+    for i in range(1, n_turning - 1):
+        condition1 = abs(turning[i] - turning[i - 1]) < std_within
+        condition2 = abs(turning[i + 1] - turning[i]) < std_within
+        to_be_kept[i] = not(condition1 or condition2)
+
+    i_turning = i_turning[to_be_kept]
+    turning = day_data[i_turning]
+
+    # Step 5: Compute the excursions
+    return np.diff(turning)
+
+
+def _mage_kernel(soa):
+    """
+    Computes MAGE+, MAGE-, MAGE and EF at once, detecting the significant turning points of each day a single time.
+
+    Parameters
+    ----------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile (see _glucose_soa).
+
+    Returns
+    -------
+    mage: dict
+        A dictionary with fields `mage_plus_index`, `mage_minus_index`, `mage_index` and `ef_index`.
+    """
+    # Manage empty and all nan data
+    if soa.t.size == 0 or np.all(soa.nan_mask):
+        return {'mage_plus_index': np.nan, 'mage_minus_index': np.nan, 'mage_index': np.nan, 'ef_index': np.nan}
 
     # Set the fixed parameter
     ef_th = 75
 
-    # Get the first and last day limits
-    first_day = pd.to_datetime(data.t.values[0]).to_pydatetime()
-    first_day = first_day.replace(hour=0, minute=0, second=0)
-    last_day = pd.to_datetime(data.t.values[-1]).to_pydatetime()
-    last_day = last_day.replace(day=last_day.day + 1, hour=0, minute=0, second=0)
-
     # Calculate the number of days and preallocate
-    n_days = (last_day - first_day).days
-    ef_day = np.empty(shape=(n_days,))
+    n_days = soa.day_limits.size - 1
+    mage_day_plus = np.full(shape=(n_days,), fill_value=np.nan)
+    mage_day_minus = np.full(shape=(n_days,), fill_value=np.nan)
+    ef_day = np.full(shape=(n_days,), fill_value=np.nan)
 
     for d in range(0, n_days):
 
-        # Step 0: parameters
-
         # Get the day of data
-        low_limit = data.t >= (first_day + timedelta(days=d))
-        high_limit = data.t < (first_day + timedelta(days=d + 1))
-        flags = np.logical_and(low_limit, high_limit)
-        day_data = data.glucose.values[flags]
-
-        # Get glucose values (might be nan)
-        std_within = np.nanstd(day_data, ddof=1)
-        n = day_data.size
-
-        if n > 3:
-            # Step 1: turning points are only local extrema
-            i_max = find_peaks(day_data)[0]
-            i_min = find_peaks(-day_data)[0]
-            i_turning = np.union1d([0, n-1], np.union1d(i_max, i_min)).astype(int)
-
-            turning = day_data[i_turning]
-            n_turning = i_turning.size
-
-            # Step 2: Turning points of no interest are removed
-            # A turning point is removed if it's not significantly different from
-            # BOTH its left and right-hand side RETAINED neighbours.
-
-            to_be_kept = [True] * n_turning
-
-            for i in range(1, n_turning-1): # First and last samples are retained
-
-                condition_1 = abs(turning[i] - turning[i - 1]) < std_within
-                condition_2 = abs(turning[i + 1] - turning[i]) < std_within
-                to_be_kept[i] = not(condition_1 and condition_2)
-
-            i_turning = i_turning[to_be_kept]
-
-            # Step 3: Turning points are removed again or moved appropriately
-            i = 1
-            while i < len(i_turning)-1:
-                prev = i_turning[i - 1]
-                curr = i_turning[i]
-                next = i_turning[i + 1]
-                prev_slope = day_data[curr] - day_data[prev]
-                next_slope = day_data[next] - day_data[curr]
-
-                if prev_slope < 0 and next_slope > 0:  # Minimum
-                    # The actual current turning point is the min in the interval
-                    temp = np.nanargmin(day_data[prev:(next+1)]) + prev
-                    curr = temp
-                    i_turning[i] = curr
-                    # The actual previous turning point is the max to the left of the current turning point.
-                    temp = np.nanargmax(day_data[prev:curr]) + prev
-                    i_turning[i - 1] = temp
-                    # The actual following turning point is the max to the right of the current turning point.
-                    temp = np.nanargmax(day_data[(curr + 1):(next+1)]) + curr + 1
-                    i_turning[i + 1] = temp
-
-                    i += 1
-                elif prev_slope > 0 and next_slope < 0:  # Maximum
-                    # The actual current turning point is the max in the interval
-                    temp = np.nanargmax(day_data[prev:(next+1)]) + prev
-                    curr = temp
-                    i_turning[i] = curr
-                    # The actual previous turning point is the min to the left of the current turning point.
-                    temp = np.nanargmin(day_data[prev:curr]) + prev
-                    i_turning[i - 1] = temp
-                    # The actual following turning point is the min to the right of the current turning point.
-                    temp = np.nanargmin(day_data[(curr + 1):(next+1)]) + curr + 1
-                    i_turning[i + 1] = temp
-
-                    i += 1
-                else:  # Middle point
-                    i_turning = np.delete(i_turning, i)
-
-            # Step 4: Remove residual spurious turning points.
-            # Turning points not significantly different from EITHER neighbour are
-            # removed. Some extra processing is needed for the first and last sample.
-            sample1 = day_data[i_turning[0]]
-            sample2 = day_data[i_turning[1]]
-
-            if abs(sample2 - sample1) < std_within:
-                i_turning = np.delete(i_turning, 0)
-
-            if len(i_turning) > 1:
-                # Last sample processing
-                sample1 = day_data[i_turning[-2]]
-                sample2 = day_data[i_turning[-1]]
-                if abs(sample2 - sample1) < std_within:
-                    i_turning = np.delete(i_turning, len(i_turning)-1)
-
-            turning = day_data[i_turning]
-            n_turning = len(i_turning)
-
-            # Internal points
-            to_be_kept = np.ones(n_turning, dtype=bool)
-            for i in range(1, n_turning - 1):
-                condition1 = abs(turning[i] - turning[i - 1]) < std_within
-                condition2 = abs(turning[i + 1] - turning[i]) < std_within
-                to_be_kept[i] = not(condition1 or condition2)
-
-            i_turning = i_turning[to_be_kept]
-            turning = day_data[i_turning]
-
-            # Step 5: Compute daily MAGE+
-            excursions = np.diff(turning)
+        day_data = soa.glucose[soa.day_limits[d]:soa.day_limits[d + 1]]
+
+        if day_data.size > 3:
+            excursions = _day_excursions(day_data)
+            mage_day_plus[d] = _nanmean(excursions[excursions > 0])
+            mage_day_minus[d] = _nanmean(excursions[excursions < 0])
             ef_day[d] = np.where(abs(excursions) > ef_th)[0].size
-        else:
-            ef_day[d] = np.nan
 
-    # Compute index
-    ei = np.nansum(ef_day)/n_days
+    # Compute indices
+    mage_day_plus[np.isnan(mage_day_plus)] = 0  # Correct for 'mean' behavior
+    mage_day_minus[np.isnan(mage_day_minus)] = 0  # Correct for 'mean' behavior
+    mage = dict()
+    mage['mage_plus_index'] = np.mean(mage_day_plus)
+    mage['mage_minus_index'] = -np.mean(mage_day_minus)
+    mage['mage_index'] = np.nanmean([mage['mage_plus_index'], mage['mage_minus_index']])
+    mage['ef_index'] = np.nansum(ef_day) / n_days
 
-    # Manage all nan data
-    if np.all(np.isnan(data['glucose'])):
-        ei = np.nan
+    return mage
 
-    return ei
 
 
 def modd(data):
@@ -1167,25 +1260,41 @@ def modd(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    # Build vectors
-    yesterday = timedelta(minutes=1440)
+    # Return the result
+    return _modd_from_soa(_glucose_soa(data))
 
-    n = len(data)
 
-    Dm = []
+def _modd_from_soa(soa, out=None):
+    """
+    Computes the mean of daily differences (MODD) of a glucose profile.
 
+    Parameters
+    ----------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile (see _glucose_soa).
+    out: np.ndarray, optional, default: None
+        A float64 scratch buffer of at least `soa.glucose.size` elements. If None, a new array is allocated.
 
-    for i in range(1, n):
+    Returns
+    -------
+    modd: float
+        The mean of daily differences (MODD) of the given data.
+    """
+    # Build vectors
+    yesterday = timedelta(minutes=1440)
+
+    n = soa.glucose.size
+
+    Dm = np.empty(shape=(0,))
 
-        # Find the index referring to the same time yesterday
-        j = np.where(data.t <= (pd.to_datetime(data.t.values[i]).to_pydatetime() - yesterday))[0]
+    if n > 1:
 
-        if j.size > 0:  # if there is a meaningful sample in data[j]
-            j = j[-1]
-            Dm.append(abs(data.glucose.values[i] - data.glucose.values[j]))
+        # Get the absolute differences with respect to the same time yesterday
+        Dm = _lagged_differences(soa.glucose, soa.t, np.timedelta64(yesterday), out=out)
+        np.abs(Dm, out=Dm)
 
-    if Dm:
-        modd = np.nanmean(Dm)
+    if Dm.size > 0:
+        modd = _nanmean(Dm)
     else:
         modd = np.nan
     return modd
@@ -1229,31 +1338,41 @@ def sddm_index(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    if data.t.values.size == 0:
+    # Return the result
+    return _sddm_index_from_soa(_glucose_soa(data))
+
+
+def _sddm_index_from_soa(soa):
+    """
+    Computes the standard deviation of within-day means (SDDM) index of a glucose profile.
+
+    Parameters
+    ----------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile (see _glucose_soa).
+
+    Returns
+    -------
+    sddm_index: float
+        The standard deviation of within-day means (SDDM) index of the given data.
+    """
+    if soa.t.size == 0:
         return np.nan
-    # Get the first and last day limits
-    first_day = pd.to_datetime(data.t.values[0]).to_pydatetime()
-    first_day = first_day.replace(hour=0, minute=0, second=0)
-    last_day = pd.to_datetime(data.t.values[-1]).to_pydatetime()
-    last_day = last_day.replace(day=last_day.day + 1, hour=0, minute=0, second=0)
 
     # Calculate the number of days and preallocate
-    n_days = (last_day - first_day).days
+    n_days = soa.day_limits.size - 1
     mean_within = np.zeros(shape=(n_days,))
 
     for d in range(0, n_days):
 
         # Get the day of data
-        low_limit = data.t >= (first_day + timedelta(days=d))
-        high_limit = data.t < (first_day + timedelta(days=d + 1))
-        flags = np.logical_and(low_limit, high_limit)
-        day_data = data.glucose.values[flags]
+        day_data = soa.glucose[soa.day_limits[d]:soa.day_limits[d + 1]]
 
         # Get daily mean and std
-        mean_within[d] = np.nanmean(day_data)
+        mean_within[d] = _nanmean(day_data)
 
     # Compute index
-    return np.nanstd(mean_within, ddof=1)
+    return _nanstd(mean_within, ddof=1)
 
 
 def sdw_index(data):
@@ -1294,31 +1413,41 @@ def sdw_index(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    if data.t.values.size == 0:
+    # Return the result
+    return _sdw_index_from_soa(_glucose_soa(data))
+
+
+def _sdw_index_from_soa(soa):
+    """
+    Computes the mean of within-day standard deviation (SDW) index of a glucose profile.
+
+    Parameters
+    ----------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile (see _glucose_soa).
+
+    Returns
+    -------
+    sdw_index: float
+        The mean of within-day standard deviation (SDW) index of the given data.
+    """
+    if soa.t.size == 0:
         return np.nan
-    # Get the first and last day limits
-    first_day = pd.to_datetime(data.t.values[0]).to_pydatetime()
-    first_day = first_day.replace(hour=0, minute=0, second=0)
-    last_day = pd.to_datetime(data.t.values[-1]).to_pydatetime()
-    last_day = last_day.replace(day=last_day.day + 1, hour=0, minute=0, second=0)
 
     # Calculate the number of days and preallocate
-    n_days = (last_day - first_day).days
+    n_days = soa.day_limits.size - 1
     std_within = np.zeros(shape=(n_days,))
 
     for d in range(0, n_days):
 
         # Get the day of data
-        low_limit = data.t >= (first_day + timedelta(days=d))
-        high_limit = data.t < (first_day + timedelta(days=d + 1))
-        flags = np.logical_and(low_limit, high_limit)
-        day_data = data.glucose.values[flags]
+        day_data = soa.glucose[soa.day_limits[d]:soa.day_limits[d + 1]]
 
         # Get daily mean and std
-        std_within[d] = np.nanstd(day_data, ddof=1)
+        std_within[d] = _nanstd(day_data, ddof=1)
 
     # Compute index
-    return np.nanmean(std_within)
+    return _nanmean(std_within)
 
 def glucose_roc(data):
     """
@@ -1366,9 +1495,7 @@ def glucose_roc(data):
 
     if g_roc.size > 4:
 
-        for t in range(3, g_roc.size):
-
-            g_roc[t] = (data.glucose.values[t] - data.glucose.values[t-3]) / 15
+        g_roc[3:] = (data.glucose.values[3:] - data.glucose.values[:-3]) / 15
 
     return pd.DataFrame(data={'t': data.t.values, 'glucose_roc': g_roc})
 
@@ -1411,9 +1538,32 @@ def std_glucose_roc(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    roc = glucose_roc(data)
+    # Return the result
+    return _std_glucose_roc_from_soa(_glucose_soa(data))
+
+
+def _std_glucose_roc_from_soa(soa):
+    """
+    Computes the standard deviation of the glucose rate of change of a glucose profile.
+
+    Parameters
+    ----------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile (see _glucose_soa).
+
+    Returns
+    -------
+    std_glucose_roc: float
+        The standard of glucose rate-of-change of given data.
+    """
+    g_roc = np.empty(shape=(soa.glucose.size,))
+    g_roc.fill(np.nan)
+
+    if g_roc.size > 4:
+
+        g_roc[3:] = (soa.glucose[3:] - soa.glucose[:-3]) / 15
 
-    return np.nanstd(roc.glucose_roc.values, ddof=1)
+    return _nanstd(g_roc, ddof=1)
 
 
 def cvga(data):
@@ -1455,13 +1605,30 @@ def cvga(data):
     check_data_columns(data)
     check_homogeneous_timegrid(data)
 
-    if data.t.values.size == 0:
-        return np.nan
+    # Return the result
+    return _cvga_from_soa(_glucose_soa(data))
+
 
-    roc = glucose_roc(data)
+def _cvga_from_soa(soa):
+    """
+    Computes the squared distance from the origin of the control variability grid analysis (CVGA) point of a
+    glucose profile.
+
+    Parameters
+    ----------
+    soa: _GlucoseSoA
+        The arrays of the glucose profile (see _glucose_soa).
+
+    Returns
+    -------
+    cvga: float
+        The squared distance from the origin of the CVGA point of the given data.
+    """
+    # Return nan if all values are nan
+    if soa.values.size == 0:
+        return np.nan
 
-    x = np.min([np.max([110 - np.nanmin(data.glucose.values), 0]), 60])
-    p = np.polyfit([110, 180, 300, 400], [0, 20, 40, 60], 3)
-    y = np.polyval(p, np.nanmax(data.glucose.values))
+    x = np.min([np.max([110 - np.min(soa.values), 0]), 60])
+    y = np.polyval(_CVGA_Y_POLY, np.max(soa.values))
 
     return x**2 + y**2